@@ -49,8 +49,7 @@ print("Filtered root nodes:")
 print(ag.filtered_node_ids)
 
 # write result as HTML
-html = ag.as_html_table(True)
 f = codecs.open("test.html", "w", "utf-8")
-f.write(html)
+ag.write_html_table(f, True)
 f.close()
 
@@ -91,7 +91,7 @@ def main(argv):
     if options.outputtype == "html":
         # Output as html
         f = codecs.open(files[1], "w", "utf-8")
-        f.write(ag.as_html_table(False, True))
+        ag.write_html_table(f, False, True)
         f.close()
     elif options.outputtype == "graf":
         writer = poioapi.io.graf.Writer()
@@ -11,8 +11,10 @@ from __future__ import absolute_import, unicode_literals
 
 import sys
 import os.path
+import bisect
 import re
 import codecs
+import collections
 
 from xml.dom import minidom
 from xml.etree.ElementTree import Element, SubElement, tostring
@@ -21,9 +23,12 @@ import poioapi.io.elan
 import poioapi.io.mandinka
 import poioapi.io.obt
 import poioapi.io.graf
+import poioapi.io.memory
 import poioapi.io.toolbox
 import poioapi.io.toolboxxml
 import poioapi.io.shoebox
+import poioapi.io.snapshot
+import poioapi.io.stats
 import poioapi.io.typecraft
 import poioapi.io.odin
 
@@ -36,6 +41,23 @@ class AnnotationGraph():
     """This class stores annotation data as annotation graphs and makes it
     accessible in tier hierarchies. It reads data from various file formats.
 
+    The `from_*` methods that read a file accept the parameter `memory`. If it
+    is True the annotations are stored in a compact
+    poioapi.io.memory.MemoryConverter instead of a graf.Graph. The nodes are
+    then read-only views with the same interface as graf.Node, such a graph
+    cannot be written with the `to_*` methods. If `lazy` is
+    True the nodes of a tier are only added to the graph when the tier is
+    first accessed through `nodes_for_tier`, see `load_all_tiers`.
+
+    Filters are evaluated on the root nodes one after the other. If
+    `filter_workers` is set to a number greater than 1, large sets of root
+    nodes are split into chunks that are evaluated by a pool of worker
+    processes (or threads if the start method of multiprocessing is not
+    "fork"). The results are the same as for the sequential evaluation.
+
+    Filters with literal search terms can be answered from an inverted index
+    of the tokens in the annotation values, see `build_token_index`.
+
     """
 
     def __init__(self, data_structure_type = None):
@@ -50,103 +72,181 @@ class AnnotationGraph():
                         data_structure_type)))
 
         self.graf = None
+        self.tier_table = poioapi.io.graf.TierTable()
+        self.memory = None
+        self.tier_loader = None
         self.tier_hierarchies = None
         self.meta_information = None
         self.root_tiers = []
         self.primary_data = None
         self.source_type = None
+        self.stats = None
 
         self.filters = []
         self.filtered_node_ids = []
+        self.filter_workers = None
+        self.token_index = None
+
+        self._node_index_state = None
+        self._nodes_by_tier = None
+        self._root_nodes_by_tier = None
+        self._children_by_tier = None
+        self._root_nodes_cache = None
+        self._interval_indexes = dict()
 
         self.tier_mapper = poioapi.mapper.TierMapper()
 
     @classmethod
-    def from_elan(cls, stream):
+    def from_elan(cls, stream, memory=False, lazy=False, stats=None,
+                  streaming=False):
         """This method generates a GrAF object
-        from a Elan file.
+        from a Elan file. If `streaming` is True the file is read in a
+        single pass that drops the XML elements of the annotations as soon
+        as they are read, see poioapi.io.elan.Parser.
 
         """
-        return cls._from_file(stream, poioapi.data.EAF)
+        return cls._from_file(stream, poioapi.data.EAF,
+                              memory=memory, lazy=lazy, stats=stats,
+                              streaming=streaming)
 
     @classmethod
-    def from_mandinka(cls, stream, tier_map_file_path=''):
+    def from_mandinka(cls, stream, tier_map_file_path='', memory=False,
+                      lazy=False, stats=None):
         """This method generates a GrAF object
         from a Elan file.
 
         """
         cls.tier_mapper = poioapi.io.mandinka.tier_mapping()
-        return cls._from_file(stream, poioapi.data.MANDINKA, tier_map_file_path=tier_map_file_path)
+        return cls._from_file(stream, poioapi.data.MANDINKA, tier_map_file_path=tier_map_file_path,
+                              memory=memory, lazy=lazy, stats=stats)
 
     @classmethod
-    def from_obt(cls, stream):
+    def from_obt(cls, stream, memory=False, lazy=False, stats=None):
         """This method generates a GrAF object
         from a Elan file.
 
         """
-        return cls._from_file(stream, poioapi.data.OBT)
+        return cls._from_file(stream, poioapi.data.OBT,
+                              memory=memory, lazy=lazy, stats=stats)
 
     @classmethod
-    def from_typecraft(cls, stream):
+    def from_typecraft(cls, stream, memory=False, lazy=False, stats=None):
         """This method generates a GrAF object
         from a Typecraft file.
 
         """
-        return cls._from_file(stream, poioapi.data.TYPECRAFT)
+        return cls._from_file(stream, poioapi.data.TYPECRAFT,
+                              memory=memory, lazy=lazy, stats=stats)
 
     @classmethod
-    def from_shoebox(cls, stream):
+    def from_shoebox(cls, stream, memory=False, lazy=False, stats=None):
         """This method generates a GrAF object
         from a shoebox file.
 
         """
-        return cls._from_file(stream, poioapi.data.SHOEBOX)
+        return cls._from_file(stream, poioapi.data.SHOEBOX,
+                              memory=memory, lazy=lazy, stats=stats)
 
     @classmethod
-    def from_toolboxxml(cls, stream):
+    def from_toolboxxml(cls, stream, memory=False, lazy=False, stats=None):
         """This method generates a GrAF object
         from a xml toolbox file.
 
         """
-        return cls._from_file(stream, poioapi.data.TOOLBOXXML)
+        return cls._from_file(stream, poioapi.data.TOOLBOXXML,
+                              memory=memory, lazy=lazy, stats=stats)
 
     @classmethod
-    def from_toolbox(cls, stream, tier_map_file_path=''):
+    def from_toolbox(cls, stream, tier_map_file_path='', memory=False,
+                     lazy=False, stats=None):
         """This method generates a GrAF object
         from a xml toolbox file.
 
         """
         cls.tier_mapper = poioapi.io.toolbox.tier_mapping()
-        return cls._from_file(stream, poioapi.data.TOOLBOX, tier_map_file_path=tier_map_file_path)
+        return cls._from_file(stream, poioapi.data.TOOLBOX, tier_map_file_path=tier_map_file_path,
+                              memory=memory, lazy=lazy, stats=stats)
 
     @classmethod
-    def from_graf(cls, stream):
+    def from_graf(cls, stream, tiers=None):
         """Load the project annotation graph from a GrAF/XML file or stream.
 
+        If a list of tiers is given and the file is a GrAF/XML header file,
+        only the annotation spaces of the tiers and the annotation spaces
+        they depend on are loaded. The other annotation spaces are loaded
+        the first time their nodes are requested with `nodes_for_tier`.
+
         Parameters
         ----------
         stream : str or io.stream
             The path to a GrAF/XML file.
+        tiers : list of str
+            The annotation spaces or tier names to load.
 
         """
         ag = cls()
+
+        if tiers is not None and not hasattr(stream, 'read') and \
+                os.path.splitext(stream)[1] == '.hdr':
+            loader = poioapi.io.graf.GrAFLoader(stream)
+            for tier_name in tiers:
+                loader.load_tier(tier_name)
+            ag.graf = loader.graf
+            ag.tier_loader = loader
+            ag.from_file_type = poioapi.data.GRAF
+            ag._build_node_index()
+            return ag
+
         if not hasattr(stream, 'read'):
             stream = ag._open_file_(stream)
 
         parser = graf.GraphParser()
         ag.graf = parser.parse(stream)
         ag.from_file_type = poioapi.data.GRAF
+        ag._build_node_index()
 
         return ag
 
     @classmethod
-    def from_odin(cls, stream, tier_map_file_path=''):
+    def from_snapshot(cls, inputfile):
+        """Load the annotation graph from a binary snapshot that was written
+        with `to_snapshot`. Loading a snapshot is much faster than parsing
+        the original file again.
+
+        Parameters
+        ----------
+        inputfile : str
+            The path to the snapshot file.
+
+        """
+        reader = poioapi.io.snapshot.Reader(inputfile)
+        reader.read()
+
+        ag = cls()
+        ag.graf = reader.graf
+        ag.tier_hierarchies = reader.tier_hierarchies
+        ag.meta_information = reader.meta_information
+        ag.root_tiers = reader.root_tiers
+        ag.primary_data = reader.primary_data
+        ag.source_type = reader.source_type
+        ag._build_node_index()
+
+        if ag.tier_hierarchies:
+            ag.structure_type_handler = \
+                poioapi.data.DataStructureType(ag.tier_hierarchies[0])
+
+        return ag
+
+    @classmethod
+    def from_odin(cls, stream, tier_map_file_path='', memory=False,
+                  lazy=False, stats=None):
         """This method generates a GrAF object
         from a xml ODIN file.
 
         """
         return cls._from_file(stream, poioapi.data.ODIN,
-                              tier_map_file_path=tier_map_file_path)
+                              tier_map_file_path=tier_map_file_path,
+                              memory=memory, lazy=lazy, stats=stats)
 
     def _open_file_(self, filename):
         if sys.version_info[:2] < (3, 0):
@@ -154,27 +254,20 @@ class AnnotationGraph():
 
         return codecs.open(filename, "r", "utf-8")
 
-    @classmethod
-    def _from_file(cls, stream, stream_type, tier_labels_file_path='', **kwargs):
-        ag = cls()
-
-        #load aditional tier labels if supplied
-        if tier_labels_file_path != '' and tier_labels_file_path is not None:
-            ag.tier_mapper.load_mapping(tier_labels_file_path)
-
+    def _parser_for_stream(self, stream, stream_type, streaming=False):
         # TODO: move the stream opening to the parser classes
         if stream_type != poioapi.data.TOOLBOX and \
                 stream_type != poioapi.data.MANDINKA:
             if not hasattr(stream, 'read'):
-                stream = ag._open_file_(stream)
+                stream = self._open_file_(stream)
 
         parser = None
         if stream_type == poioapi.data.EAF:
-            parser = poioapi.io.elan.Parser(stream)
+            parser = poioapi.io.elan.Parser(stream, streaming=streaming)
         elif stream_type == poioapi.data.MANDINKA:
             if not hasattr(stream, 'read'):
                 stream = codecs.open(stream, "rb")
-            parser = poioapi.io.mandinka.Parser(stream, tier_label_map=ag.tier_mapper)
+            parser = poioapi.io.mandinka.Parser(stream, tier_label_map=self.tier_mapper)
         elif stream_type == poioapi.data.OBT:
             parser = poioapi.io.obt.Parser(stream)
         elif stream_type == poioapi.data.TYPECRAFT:
@@ -186,11 +279,94 @@ class AnnotationGraph():
         elif stream_type == poioapi.data.TOOLBOX:
             if not hasattr(stream, 'read'):
                 stream = codecs.open(stream, "rb")
-            parser = poioapi.io.toolbox.Parser(stream, mapper=ag.tier_mapper)
+            parser = poioapi.io.toolbox.Parser(stream, mapper=self.tier_mapper,
+                streaming=streaming)
         elif stream_type == poioapi.data.ODIN:
             parser = poioapi.io.odin.Parser(stream)
 
+        return parser
+
+    @classmethod
+    def iter_records(cls, stream, stream_type, tier_labels_file_path=''):
+        """Parse a file record by record. A record is one annotation of a root
+        tier with all the annotations below it, e.g. one utterance of an
+        Elan file or one record of a Toolbox file. For each record an
+        AnnotationGraph is returned, that contains only the nodes of the
+        record. The graph of the previous record is not referenced anymore, so
+        writers that support streaming only keep the graph of a single record
+        in memory. Currently only the LaTeX writer implements
+        BaseWriter.write_records().
+
+        Toolbox files are read record by record, so the memory is bounded by
+        the largest record. The other parsers read the whole input before the
+        first record is returned, so the memory of the parsed input grows
+        with the file. Elan files are read with the single-pass mode of the
+        parser, that only keeps the parsed annotations and not the XML
+        elements.
+
+        Parameters
+        ----------
+        stream : str or file
+            The file or filename of the input file.
+        stream_type : int
+            The type of the input file, e.g. poioapi.data.EAF.
+        tier_labels_file_path : str
+            A file with additional tier labels.
+
+        Returns
+        -------
+        records : generator of AnnotationGraph
+            The records in the order of the parser.
+
+        """
+        ag = cls()
+        if tier_labels_file_path != '' and tier_labels_file_path is not None:
+            ag.tier_mapper.load_mapping(tier_labels_file_path)
+
+        parser = ag._parser_for_stream(stream, stream_type, streaming=True)
         converter = poioapi.io.graf.GrAFConverter(parser)
+
+        structure_type_handler = None
+        for graph in converter.iter_records():
+            if structure_type_handler is None:
+                structure_type_handler = poioapi.data.DataStructureType(
+                    converter.tier_hierarchies[0])
+                if stream_type == poioapi.data.ODIN:
+                    converter.meta_information = parser.metadata
+
+            record = cls()
+            record.tier_mapper = ag.tier_mapper
+            record.graf = graph
+            record.tier_table = converter.tier_table
+            record.tier_hierarchies = converter.tier_hierarchies
+            record.meta_information = converter.meta_information
+            record.root_tiers = converter.root_tiers
+            record.primary_data = converter.primary_data
+            record.source_type = stream_type
+            record.structure_type_handler = structure_type_handler
+            record._build_node_index()
+
+            yield record
+
+    @classmethod
+    def _from_file(cls, stream, stream_type, tier_labels_file_path='',
+                   memory=False, lazy=False, stats=None, streaming=False,
+                   **kwargs):
+        ag = cls()
+        ag.stats = stats
+
+        #load aditional tier labels if supplied
+        if tier_labels_file_path != '' and tier_labels_file_path is not None:
+            ag.tier_mapper.load_mapping(tier_labels_file_path)
+
+        with poioapi.io.stats.phase(stats, 'read'):
+            parser = ag._parser_for_stream(stream, stream_type, streaming)
+
+        if memory:
+            converter = poioapi.io.memory.MemoryConverter(parser, stats=stats)
+        else:
+            converter = poioapi.io.graf.GrAFConverter(parser, lazy=lazy,
+                stats=stats)
         converter.parse()
         if stream_type == poioapi.data.ODIN:
             converter.meta_information = parser.metadata
@@ -198,10 +374,18 @@ class AnnotationGraph():
         ag.tier_hierarchies = converter.tier_hierarchies
         ag.meta_information = converter.meta_information
         ag.root_tiers = converter.root_tiers
-        ag.graf = converter.graf
+        if memory:
+            ag.memory = converter
+        else:
+            ag.graf = converter.graf
+            ag.tier_table = converter.tier_table
+            if lazy:
+                ag.tier_loader = converter
         ag.primary_data = converter.primary_data
 
         ag.source_type = stream_type
+        with poioapi.io.stats.phase(stats, 'index'):
+            ag._build_node_index()
 
         # set the first tier hierarchy as the default data_structure_type
         ag.structure_type_handler = \
@@ -218,6 +402,10 @@ class AnnotationGraph():
         type as the root node. The root nodes are order by the "start" value
         of their region.
 
+        The sorted list is cached for the current data structure type and is
+        only computed again when the graph or the data structure type
+        changes.
+
         Returns
         -------
         root_nodes : list of graf.Node
@@ -225,14 +413,32 @@ class AnnotationGraph():
 
         """
 
-        res = list()
-        base_tier_name = self.structure_type_handler.flat_data_hierarchy[0]
+        cache_key = self._root_nodes_key()
+        base_tier_name = cache_key[1]
+        if self._root_nodes_cache is not None and \
+                self._root_nodes_cache[0] == cache_key:
+            return list(self._root_nodes_cache[1])
+
         res = self.nodes_for_tier(base_tier_name)
 
         try:
-            return sorted(res, key=lambda node: node.links[0][0].start)
+            res = sorted(res, key=lambda node: node.links[0][0].start)
         except IndexError as indexError:
-            return res
+            pass
+
+        self._root_nodes_cache = (cache_key, res)
+        return list(res)
+
+    def _root_nodes_key(self):
+        """Return the key that identifies the current list of root nodes.
+        It changes when the graph or the data structure type changes.
+
+        """
+        self._update_node_index()
+
+        base_tier_name = self.structure_type_handler.flat_data_hierarchy[0]
+        return (self.structure_type_handler, base_tier_name,
+                self._node_index_state)
 
     def nodes_for_tier(self, tier_name, parent_node = None):
         """Retreive all nodes for a given tier name. The parameter
@@ -254,23 +460,142 @@ class AnnotationGraph():
         nodes : list of graf.Node
 
         """
-        #node = self.graf.nodes[node_id]
+        if self.memory is not None:
+            return self.memory.nodes_for_tier(tier_name, parent_node)
+
+        self._load_tier(tier_name)
+        self._update_node_index()
+
         res = []
         if parent_node:
-            for target_node in parent_node.iter_children():
-                if target_node.id.startswith(tier_name + poioapi.io.graf.GRAFSEPARATOR):
-                    res.append(target_node)
+            res = self._children_by_tier.get((parent_node.id, tier_name), [])
         else:
             if tier_name in self.root_tiers:
-                for target_node_id in self.graf.header.roots:
-                    n = self.graf.nodes[target_node_id]
-                    if n.id.startswith(tier_name + poioapi.io.graf.GRAFSEPARATOR):
-                        res.append(self.graf.nodes[target_node_id])
+                res = self._root_nodes_by_tier.get(tier_name, [])
             if len(res) == 0:
-                for target_node in self.graf.nodes:
-                    if target_node.id.startswith(tier_name + poioapi.io.graf.GRAFSEPARATOR):
-                        res.append(target_node)
-        return res
+                res = self._nodes_by_tier.get(tier_name, [])
+        return list(res)
+
+    def load_all_tiers(self):
+        """Add the nodes of all tiers that were not loaded yet to the graph.
+        This is only needed for graphs that were loaded with `lazy` set to
+        True and before the graph is accessed directly via `self.graf`.
+
+        """
+        if self.tier_loader is not None:
+            self.tier_loader.load_all_tiers()
+            self.tier_loader = None
+
+    def _load_tier(self, tier_name):
+        """Load the nodes of a tier with the tier loader. If the loader
+        returns the new nodes and the indexes were up to date, the new nodes
+        are added to the indexes, otherwise the indexes are rebuilt when
+        they are used next.
+
+        """
+        if self.tier_loader is None:
+            return
+
+        indexed = self._node_index_state == self._graph_state()
+        nodes_count = len(self.graf.nodes)
+        roots_count = len(self.graf.header.roots)
+
+        nodes = self.tier_loader.load_tier(tier_name)
+
+        # the nodes only extend the graph if no node was replaced
+        if not nodes or not indexed or \
+                len(self.graf.nodes) != nodes_count + len(nodes):
+            return
+
+        for node in nodes:
+            self._index_node(node)
+            for parent_node in node.iter_parents():
+                self._index_child(parent_node, node)
+        for node_id in self.graf.header.roots[roots_count:]:
+            node = self.graf.nodes[node_id]
+            for prefix in self.tier_table.names_for_node(node):
+                self._root_nodes_by_tier[prefix].append(node)
+
+        self._node_index_state = self._graph_state()
+
+    def add_node(self, node, parent_node=None, edge_id=None):
+        """Add a node to the annotation graph and update the tier indexes.
+        If a parent node is given the new node is connected to it with an
+        edge.
+
+        Parameters
+        ----------
+        node : graf.Node
+            The node to add.
+        parent_node : graf.Node
+            The parent of the new node.
+        edge_id : str
+            The ID of the new edge. If None the graph will create one.
+
+        """
+        self._check_graf()
+        self._update_node_index()
+
+        self.graf.nodes.add(node)
+        self._index_node(node)
+        if parent_node is not None:
+            self.graf.create_edge(parent_node, node, edge_id)
+            self._index_child(parent_node, node)
+
+        self._node_index_state = self._graph_state()
+
+    def _graph_state(self):
+        """Return a signature of the graph that changes whenever nodes, edges
+        or root nodes are added, or when the graph object is replaced.
+
+        """
+        if self.graf is None:
+            return (self.memory,)
+        return (self.graf, len(self.graf.nodes), len(self.graf.edges),
+                len(self.graf.header.roots))
+
+    def _update_node_index(self):
+        """Rebuild the tier indexes if the graph changed without going
+        through `add_node`.
+
+        """
+        if self._node_index_state != self._graph_state():
+            self._build_node_index()
+
+    def _build_node_index(self):
+        """Build the indexes that map tier names to nodes and
+        (parent node ID, tier name) pairs to the ordered child nodes. The
+        lists keep the order of the nodes in the graph and the order of the
+        children of each parent.
+
+        """
+        self._nodes_by_tier = collections.defaultdict(list)
+        self._root_nodes_by_tier = collections.defaultdict(list)
+        self._children_by_tier = collections.defaultdict(list)
+
+        if self.graf is None:
+            self._node_index_state = self._graph_state()
+            return
+
+        for node in self.graf.nodes:
+            self._index_node(node)
+            for child in node.iter_children():
+                self._index_child(node, child)
+
+        for node_id in self.graf.header.roots:
+            node = self.graf.nodes[node_id]
+            for prefix in self.tier_table.names_for_node(node):
+                self._root_nodes_by_tier[prefix].append(node)
+
+        self._node_index_state = self._graph_state()
+
+    def _index_node(self, node):
+        for prefix in self.tier_table.names_for_node(node):
+            self._nodes_by_tier[prefix].append(node)
+
+    def _index_child(self, parent_node, node):
+        for prefix in self.tier_table.names_for_node(node):
+            self._children_by_tier[(parent_node.id, prefix)].append(node)
 
     def annotations_for_tier(self, tier_name, node=None):
         """Return all annotations of the given node that belong to the given
@@ -342,6 +667,110 @@ class AnnotationGraph():
         return self.annotation_value_for_annotation(
             node.annotations.get_first())
 
+    def primary_text_for_node(self, node):
+        """Returns the primary text in the region of a node. The region
+        anchors are character offsets in the primary text. If the primary
+        text is stored in a file, only the text of the region is read.
+
+        Parameters
+        ----------
+        node : graf.Node
+            The node to return the text for.
+
+        Returns
+        -------
+        text : str
+            The primary text, or None if the node has no region or the
+            graph has no primary text.
+
+        """
+        if self.primary_data is None or len(node.links) == 0:
+            return None
+
+        region = node.links[0][0]
+        return self.primary_data.text_for_region(region.start, region.end)
+
+    def interval_index(self, tier_name):
+        """Return the index of the regions of the nodes of a tier. The index
+        is built when it is requested for the first time and again when the
+        graph changed.
+
+        Parameters
+        ----------
+        tier_name : str
+            The name of the tier.
+
+        Returns
+        -------
+        interval_index : IntervalIndex
+
+        """
+        if self.memory is None:
+            self._load_tier(tier_name)
+        state = self._graph_state()
+
+        cached = self._interval_indexes.get(tier_name)
+        if cached is not None and cached[0] == state:
+            return cached[1]
+
+        interval_index = IntervalIndex(self.nodes_for_tier(tier_name))
+        self._interval_indexes[tier_name] = (state, interval_index)
+        return interval_index
+
+    def nodes_for_time_range(self, tier_name, start, end,
+                             relation="overlaps"):
+        """Return the nodes of a tier whose region is in the given relation
+        to the range from start to end, sorted by the start of the regions.
+        For graphs from Elan files the anchors of the regions are
+        milliseconds.
+
+        Parameters
+        ----------
+        tier_name : str
+            The name of the tier.
+        start : int
+            The start of the range.
+        end : int
+            The end of the range.
+        relation : str
+            "overlaps" for regions that overlap the range, "contains" for
+            regions that contain the range and "within" for regions that
+            are within the range.
+
+        Returns
+        -------
+        nodes : list of graf.Node
+
+        """
+        interval_index = self.interval_index(tier_name)
+        if relation == "overlaps":
+            return interval_index.overlapping(start, end)
+        elif relation == "contains":
+            return interval_index.containing(start, end)
+        elif relation == "within":
+            return interval_index.within(start, end)
+
+        raise ValueError("Unknown relation {0}".format(relation))
+
+    def nearest_node_for_time(self, tier_name, time):
+        """Return the node of a tier whose region is nearest to the given
+        time.
+
+        Parameters
+        ----------
+        tier_name : str
+            The name of the tier.
+        time : int
+            The time, in the unit of the region anchors.
+
+        Returns
+        -------
+        node : graf.Node
+            The nearest node or None if no node of the tier has a region.
+
+        """
+        return self.interval_index(tier_name).nearest(time)
+
     def as_html_table(self, filtered = False, full_html = True):
         """Return the graph as a HTML table.
 
@@ -358,31 +787,77 @@ class AnnotationGraph():
         html = str
             The HTML for the GrAF graph.
 
+        See also
+        --------
+        iter_html_table, write_html_table
+
         """
-        html = ""
-        if full_html:
-            html = "<html><head><meta http-equiv=\"Content-Type\" content=\"text/html; charset=utf-8\" /></head><body>\n"
+        return "".join(self.iter_html_table(filtered, full_html))
 
-        for i, root_node in enumerate(self.root_nodes()):
-            if filtered and (len(self.filtered_node_ids) == 0 or \
-                    root_node.id not in self.filtered_node_ids[-1]):
-                continue
+    def write_html_table(self, stream, filtered = False, full_html = True):
+        """Write the graph as a HTML table to a stream. The table of each
+        root node is written as soon as it is created, so the whole page
+        is never held in memory.
+
+        Parameters
+        ----------
+        stream : io stream
+            A stream opened for writing text, e.g. with codecs.open().
+        filtered : bool
+            Whether to us the filtered graph or the full graph.
+        full_html: bool
+            Whether to write a complete HTML page (i.e. with "<html>" etc.)
+            or just the <table> element.
 
-            html += "<table style=\"border-collapse:collapse;border:1px solid black;margin-bottom:20px;\">"
-            html += "<tr><td style=\"padding:4px;border:1px solid black;\">{0}</td>".format(i)
-            html += "<td style=\"border:1px solid black;\">"
+        """
+        for fragment in self.iter_html_table(filtered, full_html):
+            stream.write(fragment)
 
-            html += self._node_as_html_table(
-                root_node, self.structure_type_handler.data_hierarchy)
+    def iter_html_table(self, filtered = False, full_html = True):
+        """Generate the HTML table of the graph fragment by fragment. There
+        is one fragment for each root node, plus the page header and footer
+        if `full_html` is True.
+
+        Parameters
+        ----------
+        filtered : bool
+            Whether to us the filtered graph or the full graph.
+        full_html: bool
+            Whether to generate a complete HTML page (i.e. with "<html>" etc.)
+            or just the <table> element.
 
-            html += "</td></tr></table>"
+        Yields
+        ------
+        html : str
+            A fragment of the HTML for the GrAF graph.
 
+        """
         if full_html:
-            html += "</body></html>"
+            yield "<html><head><meta http-equiv=\"Content-Type\" content=\"text/html; charset=utf-8\" /></head><body>\n"
+
+        root_nodes = self.root_nodes()
+        if not filtered:
+            positions = range(len(root_nodes))
+        elif len(self.filtered_node_ids) == 0:
+            positions = []
+        else:
+            positions = self._filter_candidates(root_nodes)
 
-        return html
+        for i in positions:
+            html = ["<table style=\"border-collapse:collapse;border:1px solid black;margin-bottom:20px;\">",
+                    "<tr><td style=\"padding:4px;border:1px solid black;\">{0}</td>".format(i),
+                    "<td style=\"border:1px solid black;\">"]
 
-    def _node_as_html_table(self, node, hierarchy):
+            self._node_as_html_table(root_nodes[i],
+                self.structure_type_handler.data_hierarchy, html)
+
+            html.append("</td></tr></table>")
+            yield "".join(html)
+
+        if full_html:
+            yield "</body></html>"
+
+    def _node_as_html_table(self, node, hierarchy, table):
         """Create an html table for a node.
 
         Parameters
@@ -391,32 +866,24 @@ class AnnotationGraph():
             The root node to start the traversal.
         hierarchy: array_like
             An array with the data structure hierarchy.
-
-        Returns
-        -------
-        html : str
-            An html table of the node.
+        table : list of str
+            The list that the fragments of the html table are appended to.
 
         """
 
-        table = "<table style=\"margin:0;padding:0;float:left;border-collapse:collapse;\">"
+        table.append("<table style=\"margin:0;padding:0;float:left;border-collapse:collapse;\">")
 
-        inserted = 0
+        for t in hierarchy:
 
-        for i, t in enumerate(hierarchy):
-
-            table += "<tr style=\"margin:0;padding:0;\">"
+            table.append("<tr style=\"margin:0;padding:0;\">")
 
             if type(t) is list:
-                table += "<td style=\"margin:0;padding:0px;\">"
-                node_list = self.nodes_for_tier(t[0], node)
-                for i, n in enumerate(node_list):
-                    table += self._node_as_html_table(n, t)
+                table.append("<td style=\"margin:0;padding:0px;\">")
+                for n in self.nodes_for_tier(t[0], node):
+                    self._node_as_html_table(n, t, table)
 
-                table += "</td>"
+                table.append("</td>")
             else:
-                #row = self.structure_type_handler.flat_data_hierarchy.index(t)
-
                 a_list = self.annotations_for_tier(t, node)
                 a = ""
                 if len(a_list) > 0:
@@ -424,23 +891,32 @@ class AnnotationGraph():
                 if a == "":
                     a = "&nbsp;"
 
-                #if column in table[row]:
-                #    table[row][column] = (a, table[row][column][1])
-                #else:
-                #    table[row][column] = (a, 1)
-                table += "<td style=\"margin:0;padding:3px;\">{0}</td>".format(a)
+                table.append("<td style=\"margin:0;padding:3px;\">{0}</td>".format(a))
+
+            table.append("</tr>")
 
-            table += "</tr>"
+        table.append("</table>")
 
-        table += "</table>"
-        return table
+    def _check_graf(self):
+        """Raise a ValueError if the annotations are not stored in a GrAF
+        graph, i.e. if the graph was loaded with `memory` set to True.
+
+        """
+        if self.graf is None:
+            raise ValueError(
+                "The annotation graph has no GrAF graph. Graphs that were "
+                "loaded with memory=True cannot be written or changed, load "
+                "the file with memory=False instead.")
 
     def to_elan(self, outputfile):
         """Write the annotation graph as Elan EAF files.
         """
+        self._check_graf()
+        self.load_all_tiers()
         converter = poioapi.io.graf.GrAFConverter(
-            None, poioapi.io.elan.Writer())
+            None, poioapi.io.elan.Writer(), stats=self.stats)
         converter.graf = self.graf
+        converter.tier_table = self.tier_table
         converter.tier_hierarchies = self.tier_hierarchies
         converter.meta_information = self.meta_information
         converter.write(outputfile)
@@ -455,13 +931,31 @@ class AnnotationGraph():
             GrAF/XML files, it should have the extension ".hdr".
 
         """
+        self._check_graf()
+        self.load_all_tiers()
         converter = poioapi.io.graf.GrAFConverter(
-            None, poioapi.io.graf.Writer())
+            None, poioapi.io.graf.Writer(), stats=self.stats)
         converter.graf = self.graf
+        converter.tier_table = self.tier_table
         converter.tier_hierarchies = self.tier_hierarchies
         converter.meta_information = self.meta_information
+        converter.primary_data = self.primary_data
         converter.write(outputfile)
 
+    def to_snapshot(self, outputfile):
+        """Write the annotation graph as binary snapshot. The snapshot can
+        be loaded with `from_snapshot`.
+
+        Parameters
+        ----------
+        outputfile : str
+            The path to the output file.
+
+        """
+        self._check_graf()
+        self.load_all_tiers()
+        poioapi.io.snapshot.Writer().write(outputfile, self)
+
     def generate_graf_files(self, inputfile, outputfile):
         """This method will create the GrAF Xml files.
         But first is need to create the GrAF object in
@@ -484,6 +978,8 @@ class AnnotationGraph():
 
         """
 
+        self._check_graf()
+        self.load_all_tiers()
         graf_xml_writer = poioapi.io.graf.Writer()
         graf_xml_writer.generate_graf_files(self.graf, inputfile)
 
@@ -548,15 +1044,121 @@ class AnnotationGraph():
         """
 
         self.filters.append(filter)
+        self.filtered_node_ids.append(self._apply_filter(filter))
+
+    def _apply_filter(self, filter):
+        """Evaluate a filter on the root nodes that passed the last filter
+        on the stack, or on all root nodes if the stack is empty.
+
+        Parameters
+        ----------
+        filter : AnnotationGraphFilter
+            The filter to evaluate.
+
+        Returns
+        -------
+        filtered_node_ids : FilteredNodeIds
+            The IDs and positions of the root nodes that passed.
+
+        """
+
+        root_nodes = self.root_nodes()
+        candidates = self._filter_candidates(root_nodes)
+
+        if self.token_index is not None:
+            self.token_index.update()
+            index_positions = filter.index_candidates(self.token_index)
+            if index_positions is not None:
+                candidates = [ p for p in candidates if p in index_positions ]
+
+        if self.filter_workers is not None and self.filter_workers > 1 and \
+                len(candidates) >= PARALLEL_FILTER_MIN_NODES:
+            positions = self._apply_filter_parallel(filter, root_nodes,
+                                                    candidates)
+        else:
+            positions = [ p for p in candidates
+                          if filter.element_passes_filter(root_nodes[p]) ]
+
+        return FilteredNodeIds([root_nodes[p].id for p in positions],
+                               positions)
+
+    def _apply_filter_parallel(self, filter, root_nodes, candidates):
+        """Evaluate a filter on the candidate root nodes with a pool of
+        `filter_workers` workers. The candidates are split into contiguous
+        chunks, so the merged result keeps the order of the root nodes. The
+        match spans of the workers are merged into the filter's match
+        object.
+
+        """
+
+        # everything the workers need is loaded and indexed before the pool
+        # is created, forked workers then share it with this process
+        filter.compile()
+        if self.tier_loader is not None:
+            for tier_name in self.structure_type_handler.flat_data_hierarchy:
+                self.nodes_for_tier(tier_name)
+        self._update_node_index()
+
+        candidates = list(candidates)
+        chunk_size = -(-len(candidates) // (self.filter_workers * 4))
+        chunks = [ candidates[i:i + chunk_size]
+                   for i in range(0, len(candidates), chunk_size) ]
+
+        pool = poioapi.io.graf.worker_pool(self.filter_workers,
+                                           (filter, root_nodes))
+        try:
+            results = pool.map(_filter_chunk, chunks)
+        finally:
+            pool.close()
+            pool.join()
+
+        positions = []
+        for chunk_positions, matchobject in results:
+            positions.extend(chunk_positions)
+            for t in matchobject:
+                filter.matchobject.setdefault(t, dict()).update(
+                    matchobject[t])
+
+        return positions
+
+    def build_token_index(self):
+        """Build an inverted index from the tokens of the annotation values
+        to the root nodes. Filters with literal search terms, optionally
+        between word boundaries, then only evaluate the root nodes that
+        contain the tokens of the search terms. Other search terms are still
+        evaluated on all root nodes. The index is rebuilt when the graph or
+        the data structure type changes.
+
+        Returns
+        -------
+        token_index : TokenIndex
+            The new index, also stored in `token_index`.
+
+        """
+
+        self.token_index = TokenIndex(self)
+        self.token_index.update()
+        return self.token_index
+
+    def _filter_candidates(self, root_nodes):
+        """Return the positions in `root_nodes` of the nodes that passed
+        the last filter on the stack.
+
+        """
+
+        if len(self.filtered_node_ids) == 0:
+            return range(len(root_nodes))
 
-        new_filtered_elements = \
-            [ node.id
-            for node in self.root_nodes()
-                if (len(self.filtered_node_ids) == 0 or \
-                    node.id in self.filtered_node_ids[-1]) and \
-                    filter.element_passes_filter(node)]
+        last_ids = self.filtered_node_ids[-1]
+        positions = getattr(last_ids, "positions", None)
+        if positions is not None and len(positions) == len(last_ids) and \
+                all(p < len(root_nodes) and root_nodes[p].id == node_id
+                    for p, node_id in zip(positions, last_ids)):
+            return positions
 
-        self.filtered_node_ids.append(new_filtered_elements)
+        # the root nodes changed since the last filter was applied
+        return [ p for p, node in enumerate(root_nodes)
+                 if node.id in last_ids ]
 
     def last_filter(self):
         """Return the latest added filter.
@@ -619,14 +1221,7 @@ class AnnotationGraph():
         self.filtered_node_ids = []
 
         for filter in self.filters:
-            new_filtered_elements = []
-            for node in self.root_nodes():
-                if (len(self.filtered_node_ids) == 0 or \
-                        node.id in self.filtered_node_ids[-1]) and \
-                        filter.element_passes_filter(node):
-                    new_filtered_elements.append(node.id)
-
-            self.filtered_node_ids.append(new_filtered_elements)
+            self.filtered_node_ids.append(self._apply_filter(filter))
 
     def create_filter_for_dict(self, search_dict):
         """Creates a filter based on a give dict. The keys of the dict are
@@ -652,6 +1247,309 @@ class AnnotationGraph():
         return filter
 
 
+# the minimum number of root nodes for a parallel filter evaluation, smaller
+# sets are evaluated faster than the pool is started
+PARALLEL_FILTER_MIN_NODES = 1000
+
+
+def _filter_chunk(positions):
+    """Evaluate the filter of the pool on its root nodes at the given
+    positions.
+
+    Returns
+    -------
+    result : tuple
+        The positions of the nodes that passed and the match spans of the
+        chunk, in the format of the filter's match object.
+
+    """
+    filter, root_nodes = poioapi.io.graf.worker_data()
+    matchobject = dict()
+    passed = [ p for p in positions
+               if filter._element_passes_filter(root_nodes[p], matchobject) ]
+    return passed, matchobject
+
+
+class FilteredNodeIds(list):
+    """The ordered list of the IDs of the root nodes that passed a filter.
+    Membership tests are answered from a set of the IDs. The positions of
+    the nodes in the sorted root nodes are stored as well, so that a
+    filter that is stacked on top only evaluates the nodes that passed
+    this one. The list should not be modified after it was created.
+
+    """
+
+    def __init__(self, node_ids=(), positions=None):
+        list.__init__(self, node_ids)
+        self.positions = positions
+        self._node_id_set = frozenset(self)
+
+    def __contains__(self, node_id):
+        return node_id in self._node_id_set
+
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+_REGEX_SPECIAL_CHARS = frozenset(".^$*+?{}[]|()")
+
+
+def _literal_for_pattern(pattern):
+    """Return the literal string that a regular expression matches and
+    whether it is enclosed in word boundaries. If the pattern is not a
+    literal string with optional word boundaries at both ends None is
+    returned.
+
+    Returns
+    -------
+    literal : tuple or None
+        The literal and a bool that is True if the pattern starts and ends
+        with a word boundary.
+
+    """
+
+    bounded = False
+    trailing_backslashes = len(pattern) - 1 - len(pattern[:-1].rstrip("\\"))
+    if len(pattern) > 4 and pattern.startswith(r"\b") and \
+            pattern.endswith(r"\b") and trailing_backslashes % 2 == 1:
+        pattern = pattern[2:-2]
+        bounded = True
+
+    literal = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "\\":
+            if i + 1 == len(pattern) or pattern[i + 1].isalnum() or \
+                    pattern[i + 1] == "_":
+                return None
+            literal.append(pattern[i + 1])
+            i += 2
+        elif c in _REGEX_SPECIAL_CHARS:
+            return None
+        else:
+            literal.append(c)
+            i += 1
+
+    return "".join(literal), bounded
+
+
+class TokenIndex(object):
+    """An inverted index for the filters of an annotation graph. For each
+    tier of the data structure type it maps the tokens of the annotation
+    values to the positions of the root nodes in `root_nodes()`. The tokens
+    are collected along the data hierarchy in the same way the filters
+    search the annotation values.
+
+    """
+
+    def __init__(self, annotation_graph):
+        self.annotation_graph = annotation_graph
+        self.key = None
+        self.tokens = dict()
+
+    def update(self):
+        """Build the index if the root nodes changed since it was built.
+
+        """
+
+        key = self.annotation_graph._root_nodes_key()
+        if key == self.key:
+            return
+
+        self.tokens = dict()
+        hierarchy = \
+            self.annotation_graph.structure_type_handler.data_hierarchy
+        for position, node in enumerate(self.annotation_graph.root_nodes()):
+            self._index_level(hierarchy, node, position)
+        self.key = key
+
+    def _index_level(self, hierarchy, node, position):
+        ag = self.annotation_graph
+        for t in hierarchy:
+            if type(t) is list:
+                for n in ag.nodes_for_tier(t[0], node):
+                    self._index_level(t, n, position)
+            else:
+                a_list = ag.annotations_for_tier(t, node)
+                if len(a_list) > 0:
+                    value = ag.annotation_value_for_annotation(a_list[0])
+                    tier_tokens = self.tokens.setdefault(t, dict())
+                    for token in _TOKEN_RE.findall(value or ""):
+                        tier_tokens.setdefault(token, set()).add(position)
+
+    def root_positions(self, tier, pattern):
+        """Return the positions of the root nodes where the given pattern
+        can match in the given tier. The result may contain root nodes where
+        the pattern does not match, but it contains all root nodes where it
+        matches.
+
+        Parameters
+        ----------
+        tier : str
+            The name of the tier.
+        pattern : str
+            The regular expression.
+
+        Returns
+        -------
+        positions : set of int or None
+            The positions of the root nodes or None if the index cannot
+            answer the pattern.
+
+        """
+
+        literal = _literal_for_pattern(pattern)
+        if literal is None:
+            return None
+        literal, bounded = literal
+
+        tokens = _TOKEN_RE.findall(literal)
+        if len(tokens) == 0:
+            return None
+
+        tier_tokens = self.tokens.get(tier, dict())
+        if bounded and tokens == [literal]:
+            return set(tier_tokens.get(literal, ()))
+
+        # each token of the literal is part of a token of the value
+        positions = None
+        for token in tokens:
+            token_positions = set()
+            for t, p in tier_tokens.items():
+                if token in t:
+                    token_positions.update(p)
+            if positions is None:
+                positions = token_positions
+            else:
+                positions &= token_positions
+        return positions
+
+
+class IntervalIndex(object):
+    """An index of the regions of the nodes of a tier. The nodes are sorted
+    by the start of their first region. Two implicit binary trees over the
+    sorted nodes store the maximum and the minimum end of the regions in
+    each subtree, so that overlap and containment queries only visit the
+    subtrees that contain results. The queries take O(log n + k log n) time
+    for k results. Nodes without regions are not indexed.
+
+    Parameters
+    ----------
+    nodes : list of graf.Node
+        The nodes of the tier.
+
+    """
+
+    def __init__(self, nodes):
+        intervals = []
+        for node in nodes:
+            if len(node.links) > 0:
+                region = node.links[0][0]
+                intervals.append((region.start, region.end, node))
+        intervals.sort(key=lambda interval: interval[0])
+
+        self.nodes = [interval[2] for interval in intervals]
+        self.starts = [interval[0] for interval in intervals]
+        self.ends = [interval[1] for interval in intervals]
+
+        # the positions of the nodes sorted by the end of their regions
+        self._positions_by_end = sorted(range(len(self.nodes)),
+            key=lambda position: self.ends[position])
+        self._sorted_ends = [self.ends[p] for p in self._positions_by_end]
+
+        self._size = 1
+        while self._size < len(self.nodes):
+            self._size *= 2
+        self._max_end = self._tree(max, float("-inf"))
+        self._min_end = self._tree(min, float("inf"))
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def _tree(self, function, padding):
+        tree = [padding] * (2 * self._size)
+        tree[self._size:self._size + len(self.ends)] = self.ends
+        for i in range(self._size - 1, 0, -1):
+            tree[i] = function(tree[2 * i], tree[2 * i + 1])
+        return tree
+
+    def _search(self, tree, lo, hi, matches):
+        """Return the nodes at the positions lo to hi whose end matches, in
+        the order of their start. A subtree is only visited if the end that
+        is stored for it matches.
+
+        """
+        result = []
+        stack = [(1, 0, self._size)]
+        while stack:
+            i, node_lo, node_hi = stack.pop()
+            if node_hi <= lo or node_lo >= hi or not matches(tree[i]):
+                continue
+            if i >= self._size:
+                result.append(self.nodes[node_lo])
+            else:
+                middle = (node_lo + node_hi) // 2
+                stack.append((2 * i + 1, middle, node_hi))
+                stack.append((2 * i, node_lo, middle))
+        return result
+
+    def overlapping(self, start, end):
+        """Return the nodes whose region overlaps the range from start to
+        end. If start equals end, the nodes whose region contains this point
+        are returned, the end of a region is not part of the region.
+
+        """
+        if end > start:
+            hi = bisect.bisect_left(self.starts, end)
+        else:
+            hi = bisect.bisect_right(self.starts, start)
+        return self._search(self._max_end, 0, hi, lambda e: e > start)
+
+    def containing(self, start, end):
+        """Return the nodes whose region contains the range from start to
+        end.
+
+        """
+        hi = bisect.bisect_right(self.starts, start)
+        return self._search(self._max_end, 0, hi, lambda e: e >= end)
+
+    def within(self, start, end):
+        """Return the nodes whose region is within the range from start to
+        end.
+
+        """
+        lo = bisect.bisect_left(self.starts, start)
+        hi = bisect.bisect_right(self.starts, end)
+        return self._search(self._min_end, lo, hi, lambda e: e <= end)
+
+    def nearest(self, time):
+        """Return the node whose region is nearest to the given time. A
+        region that contains the time has the distance 0. If two regions
+        have the same distance, the node that starts first is returned.
+
+        """
+        containing = self.overlapping(time, time)
+        if len(containing) > 0:
+            return containing[0]
+
+        candidates = []
+
+        # the first region that starts after the time
+        position = bisect.bisect_left(self.starts, time)
+        if position < len(self.nodes):
+            candidates.append((self.starts[position] - time, position))
+
+        # the last region that ends before the time
+        position = bisect.bisect_right(self._sorted_ends, time)
+        if position > 0:
+            position = self._positions_by_end[position - 1]
+            candidates.append((time - self.ends[position], position))
+
+        if len(candidates) == 0:
+            return None
+        return self.nodes[min(candidates)[1]]
+
+
 class AnnotationGraphFilter():
     """
     AnnotationGraphFilter tree-like structure constructor.
@@ -678,6 +1576,7 @@ class AnnotationGraphFilter():
         self.inverted = False
         self.boolean_operation = self.AND
         self.contained_matches = False
+        self._compiled_filter = None
 
     def reset_match_object(self):
         """Reset a match object.
@@ -702,6 +1601,88 @@ class AnnotationGraphFilter():
 
         self.filter[ann_type] = filter_string
 
+    def compile(self):
+        """Compile the filter for the current data structure type. All the
+        non-empty tier filters are compiled to regular expressions once and
+        the data hierarchy is reduced to the levels that are needed to
+        evaluate them. The compiled filter is cached and compiled again when
+        the filter strings or the data hierarchy change.
+
+        Returns
+        -------
+        compiled_filter : _CompiledFilterLevel
+            The top level of the compiled filter.
+
+        """
+
+        hierarchy = self.annotation_graph.structure_type_handler.data_hierarchy
+        filter_items = sorted(self.filter.items())
+
+        if self._compiled_filter is None or \
+                self._compiled_filter[0] is not hierarchy or \
+                self._compiled_filter[1] != filter_items:
+            self._compiled_filter = (hierarchy, filter_items,
+                self._compile_level(hierarchy))
+
+        return self._compiled_filter[2]
+
+    def _compile_level(self, hierarchy):
+        level = _CompiledFilterLevel(hierarchy[0])
+
+        for t in hierarchy:
+            if type(t) is list:
+                child = self._compile_level(t)
+                level.children.append(child)
+                level.tiers.extend(child.tiers)
+                if child.has_patterns:
+                    level.has_patterns = True
+            else:
+                level.tiers.append(t)
+                if self.filter[t] != "":
+                    level.patterns.append((t, re.compile(self.filter[t])))
+                    level.has_patterns = True
+                else:
+                    level.unfiltered.append(t)
+
+        return level
+
+    def index_candidates(self, token_index):
+        """Return the positions of the root nodes that can pass the filter
+        according to a token index. All other root nodes do not pass the
+        filter and have no matches. The index can only be used for filters
+        that combine the tiers with AND, are not inverted and where every
+        search term is a literal.
+
+        Parameters
+        ----------
+        token_index : TokenIndex
+            The token index of the annotation graph.
+
+        Returns
+        -------
+        positions : set of int or None
+            The root node positions or None if the index cannot be used.
+
+        """
+
+        compiled_filter = self.compile()
+        if not compiled_filter.has_patterns or self.inverted or \
+                self.boolean_operation != self.AND:
+            return None
+
+        positions = set()
+        levels = [compiled_filter]
+        while levels:
+            level = levels.pop()
+            for t, regex in level.patterns:
+                tier_positions = token_index.root_positions(t, regex.pattern)
+                if tier_positions is None:
+                    return None
+                positions |= tier_positions
+            levels.extend(level.children)
+
+        return positions
+
     def element_passes_filter(self, node):
         """Verify if a specific element passes in through a filter.
 
@@ -717,77 +1698,88 @@ class AnnotationGraphFilter():
 
         See also
         --------
-        _passes_filter
+        compile, _passes_filter
 
         """
 
+        return self._element_passes_filter(node, self.matchobject)
+
+    def _element_passes_filter(self, node, matchobject):
         # is there a filter defined?
-        all_filter_empty = True
-        result_dict = {}
-        for ann_type in self.filter:
-            if self.filter[ann_type] != "":
-                all_filter_empty = False
-            result_dict[ann_type] = False
-
-        if all_filter_empty:
+        if not any(self.filter.values()):
             return True
 
-        self._passes_filter(
-            result_dict, node,
-            self.annotation_graph.structure_type_handler.data_hierarchy)
+        compiled_filter = self.compile()
+
+        result_dict = dict((ann_type, False) for ann_type in self.filter)
+
+        self._passes_filter(result_dict, node, compiled_filter, matchobject)
 
         if self.boolean_operation == self.AND:
-            passed = True
+            passed = all(result_dict.values())
         else:
-            passed = False
-
-        for ann_type in self.filter:
-            if self.boolean_operation == self.AND:
-                passed = (passed and result_dict[ann_type])
-            else:
-                passed = (passed or result_dict[ann_type])
+            passed = any(result_dict.values())
 
         if self.inverted:
             passed = not passed
 
         return passed
 
-    def _passes_filter(self, result_dict, node, hierarchy):
-        """Verify if a specific element passes in through a filter.
+    def _passes_filter(self, result_dict, node, level, matchobject):
+        """Verify if a specific element passes in through a filter. Tiers
+        without a filter pass as soon as their level in the hierarchy is
+        reached. Levels without any filter are only descended until all of
+        their tiers passed.
 
         Parameters
         ----------
-        passed : bool
-            Passes or not.
+        result_dict : dict
+            The result for each tier. Tiers that pass are set to True.
         node : graf.Node
             The start node for the search.
-        hirerarchy : list of lists
-            The hierarchical data structure for the search.
-
-        Returns
-        -------
-        passed : bool
-            Passes or not.
+        level : _CompiledFilterLevel
+            The compiled hierarchy level of the node.
+        matchobject : dict
+            The match spans are added to this dict, for each tier a dict
+            from node IDs to spans.
 
         """
 
-        for i, t in enumerate(hierarchy):
-            if type(t) is list:
-                local_passes = False
-                node_list = self.annotation_graph.nodes_for_tier(t[0], node)
-                for i, n in enumerate(node_list):
-                    self._passes_filter(result_dict, n, t)
-
-            else:
-                a_list = self.annotation_graph.annotations_for_tier(t, node)
-                if self.filter[t] != "":
-                    if len(a_list) > 0:
-                        a = self.annotation_graph.annotation_value_for_annotation(a_list[0])
-                        match = re.search(self.filter[t], a)
-                        if match:
-                            self.matchobject[t][node.id] =\
-                            [ [m.start(), m.end()] for m in re.finditer(
-                                self.filter[t], a) ]
-                            result_dict[t] = True
-                else:
+        for t in level.unfiltered:
+            result_dict[t] = True
+
+        for t, regex in level.patterns:
+            a_list = self.annotation_graph.annotations_for_tier(t, node)
+            if len(a_list) > 0:
+                a = self.annotation_graph.annotation_value_for_annotation(
+                    a_list[0])
+                spans = [ [m.start(), m.end()] for m in regex.finditer(a) ]
+                if len(spans) > 0:
+                    matchobject.setdefault(t, dict())[node.id] = spans
                     result_dict[t] = True
+
+        for child in level.children:
+            for n in self.annotation_graph.nodes_for_tier(child.tier, node):
+                if not child.has_patterns and \
+                        all(result_dict[t] for t in child.tiers):
+                    break
+                self._passes_filter(result_dict, n, child, matchobject)
+
+
+class _CompiledFilterLevel(object):
+    """One level of the data hierarchy in a compiled AnnotationGraphFilter.
+    The tier is the first tier of the level, the patterns are pairs of
+    tier names and compiled regular expressions.
+
+    """
+
+    __slots__ = ['tier', 'patterns', 'unfiltered', 'children', 'tiers',
+                 'has_patterns']
+
+    def __init__(self, tier):
+        self.tier = tier
+        self.patterns = []
+        self.unfiltered = []
+        self.children = []
+        self.tiers = []
+        self.has_patterns = False
@@ -18,6 +18,7 @@ read-/writeable.
 
 from __future__ import absolute_import
 
+import bisect
 import collections
 
 import xml.etree.ElementTree as ET
@@ -37,23 +38,89 @@ class ElanTier(poioapi.io.graf.Tier):
         self.annotation_space = linguistic_type
 
 
+class _RegionIndex(object):
+    """An index of the regions of the alignable annotations of a tier. The
+    regions are sorted by their start and an implicit binary tree stores the
+    maximum end of the regions in each subtree, so that only the subtrees
+    with regions that can contain a given region are visited.
+
+    Parameters
+    ----------
+    regions : dict
+        The annotation elements of a tier with their (start, end) region as
+        keys, in document order.
+
+    """
+
+    def __init__(self, regions):
+        entries = sorted(
+            ((s, e, position, a)
+             for position, ((s, e), a) in enumerate(regions.items())),
+            key=lambda entry: entry[0])
+        self.entries = entries
+        self.starts = [entry[0] for entry in entries]
+
+        self._size = 1
+        while self._size < len(entries):
+            self._size *= 2
+        self._max_end = [None] * (2 * self._size)
+        for i, entry in enumerate(entries):
+            self._max_end[self._size + i] = entry[1]
+        for i in range(self._size - 1, 0, -1):
+            left, right = self._max_end[2 * i], self._max_end[2 * i + 1]
+            if left is None or (right is not None and right > left):
+                left = right
+            self._max_end[i] = left
+
+    def first_containing(self, start, end):
+        """Return the annotation of the first region in document order that
+        contains the region from start to end.
+
+        """
+        hi = bisect.bisect_right(self.starts, start)
+        result = None
+        stack = [(1, 0, self._size)]
+        while stack:
+            i, node_lo, node_hi = stack.pop()
+            max_end = self._max_end[i]
+            if node_lo >= hi or max_end is None or max_end < end:
+                continue
+            if i >= self._size:
+                entry = self.entries[node_lo]
+                if result is None or entry[2] < result[2]:
+                    result = entry
+            else:
+                middle = (node_lo + node_hi) // 2
+                stack.append((2 * i + 1, middle, node_hi))
+                stack.append((2 * i, node_lo, middle))
+
+        if result is None:
+            return None
+        return result[3]
+
+
 class Parser(poioapi.io.graf.BaseParser):
     """
     Class that will handle parse Elan files.
 
     """
 
-    def __init__(self, filepath):
+    def __init__(self, filepath, streaming=False):
         """Class's constructor.
 
         Parameters
         ----------
         filepath : str
             Path of the elan file.
+        streaming : bool
+            If True the file is read in a single pass with iterparse. Only
+            the elements outside of the tiers are kept in `tree`, the tiers
+            are kept without their annotations.
 
         """
 
         self.filepath = filepath
+        self.streaming = streaming
         self._parse()
 
     def _parse(self):
@@ -65,14 +132,96 @@ class Parser(poioapi.io.graf.BaseParser):
         # With the python 2.x the element tree the strings
         # are somehow mixed with "str" and "unicode" types.
         # http://stackoverflow.com/questions/3418262/python-unicode-and-elementtree-parse
-        self.root = ET.parse(self.filepath)
-        self.tree = self.root.getroot()
+        if self.streaming:
+            self._iterparse()
+        else:
+            self.root = ET.parse(self.filepath)
+            self.tree = self.root.getroot()
+            self._tier_annotations = None
+        self._map_tiers()
         self.time_order = self._map_time_slots()
         self.annotations_for_parent = collections.defaultdict(list)
         self.regions_map = {}
         self.regions_cache = {}
         self.meta_information = self._retrieve_aditional_information()
+        if self.streaming:
+            # the time slots are kept in the time order and the meta
+            # information
+            del self.tree.find('TIME_ORDER')[:]
         self._build_annotations()
+        self._tier_annotations = None
+
+    def _iterparse(self):
+        """Read the EAF file in a single pass. The annotation elements are
+        collected for each tier with their value and without their child
+        elements, they are removed from the tree as soon as they are read.
+
+        """
+
+        self.tree = None
+        self._tier_annotations = dict()
+
+        tier = None
+        annotations = None
+        depth = 0
+        for event, element in ET.iterparse(self.filepath,
+                                           events=("start", "end")):
+            if event == "start":
+                if self.tree is None:
+                    self.tree = element
+                elif depth == 1 and element.tag == "TIER":
+                    tier = element
+                    annotations = self._tier_annotations[tier] = []
+                depth += 1
+                continue
+
+            depth -= 1
+            if tier is None:
+                continue
+
+            if depth == 3:
+                # an ALIGNABLE_ANNOTATION or REF_ANNOTATION
+                annotations.append(
+                    (element, element.find('ANNOTATION_VALUE').text))
+                del element[:]
+            elif depth == 2:
+                # the ANNOTATION element
+                del tier[:]
+            elif depth == 1:
+                tier = None
+
+        self.root = ET.ElementTree(self.tree)
+
+    def _annotation_elements(self, tier):
+        """Return the annotation elements of a TIER element with their
+        annotation values.
+
+        """
+        if self._tier_annotations is not None:
+            return self._tier_annotations[tier]
+
+        return [(a, a.find('ANNOTATION_VALUE').text)
+                for a in tier.findall("ANNOTATION/*")]
+
+    def _map_tiers(self):
+        """Build the tables of the tier hierarchy and the linguistic types,
+        so that the tier queries do not search the tree.
+
+        """
+
+        self._tiers = self.tree.findall("TIER")
+        self._tier_for_name = dict()
+        self._child_tiers = collections.defaultdict(list)
+        for t in self._tiers:
+            self._tier_for_name.setdefault(t.attrib['TIER_ID'], t)
+            self._child_tiers[t.attrib.get('PARENT_REF')].append(t)
+
+        self._time_alignable = dict()
+        for l in self.tree.findall("LINGUISTIC_TYPE"):
+            linguistic_type = l.attrib["LINGUISTIC_TYPE_ID"]
+            self._time_alignable[linguistic_type] = \
+                self._time_alignable.get(linguistic_type, False) or \
+                l.attrib.get('TIME_ALIGNABLE') == 'true'
 
     def get_root_tiers(self):
         """This method retrieves all the root tiers.
@@ -88,8 +237,7 @@ class Parser(poioapi.io.graf.BaseParser):
 
         return [ElanTier(
                     tier.attrib['TIER_ID'], tier.attrib['LINGUISTIC_TYPE_REF'])
-                for tier in self.tree.findall('TIER')
-                if not 'PARENT_REF' in tier.attrib]
+                for tier in self._child_tiers.get(None, [])]
 
     def get_tier_by_name(self, name):
         """This method retrieves a tier by it's name.
@@ -100,10 +248,10 @@ class Parser(poioapi.io.graf.BaseParser):
             The tier with the given name.
 
         """
-        for tier in self.tree.findall('TIER'):
-            if tier.attrib['TIER_ID'] == name:
-                return ElanTier(
-                    tier.attrib['TIER_ID'], tier.attrib['LINGUISTIC_TYPE_REF'])
+        tier = self._tier_for_name.get(name)
+        if tier is not None:
+            return ElanTier(
+                tier.attrib['TIER_ID'], tier.attrib['LINGUISTIC_TYPE_REF'])
 
     def get_child_tiers_for_tier(self, tier):
         """This method retrieves all the child tiers
@@ -124,9 +272,7 @@ class Parser(poioapi.io.graf.BaseParser):
         """
 
         return [ElanTier(t.attrib['TIER_ID'], t.attrib['LINGUISTIC_TYPE_REF'])
-                for t in self.tree.findall("TIER")
-                if "PARENT_REF" in t.attrib and
-                   t.attrib["PARENT_REF"] == tier.name]
+                for t in self._child_tiers.get(tier.name, [])]
 
     def get_annotations_for_tier(self, tier, annotation_parent=None):
         """This method retrieves all the annotations
@@ -160,14 +306,35 @@ class Parser(poioapi.io.graf.BaseParser):
         return self.annotations_for_parent[(parent_id, tier.name)]
 
 
+    def _tiers_parents_first(self):
+        """Return the TIER elements in document order, but with each tier
+        after its parent tier.
+
+        """
+        ordered = []
+        visited = set()
+        for t in self._tiers:
+            # collect the tier and its ancestors that were not added yet
+            chain = []
+            while t is not None and t.attrib['TIER_ID'] not in visited:
+                visited.add(t.attrib['TIER_ID'])
+                chain.append(t)
+                t = self._tier_for_name.get(t.attrib.get('PARENT_REF'))
+            ordered.extend(reversed(chain))
+
+        return ordered
+
     def _build_annotations(self):
-        for t in self.tree.findall("TIER"):
+        parent_tiers = set(name for name in self._child_tiers
+                           if name is not None)
+        self._region_indexes = dict()
+
+        for t in self._tiers_parents_first():
             tier = ElanTier(
                 t.attrib['TIER_ID'], t.attrib['LINGUISTIC_TYPE_REF'])
             self.regions_cache[tier.name] = dict()
-            for a in t.findall("ANNOTATION/*"):
+            for a, annotation_value in self._annotation_elements(t):
                 annotation_id = a.attrib['ANNOTATION_ID']
-                annotation_value = a.find('ANNOTATION_VALUE').text
                 features = {}
 
                 parent_annotation_id = None
@@ -208,15 +375,26 @@ class Parser(poioapi.io.graf.BaseParser):
                     append(poioapi.io.graf.Annotation(
                         annotation_id, annotation_value, features))
 
+            # the tier is complete, the index for its child tiers is built
+            # when the first parent annotation is searched
+            if tier.name in parent_tiers:
+                self._region_indexes[tier.name] = None
+
     def _annotation_for_region(self, tier_name, start, end):
-        if tier_name in self.regions_cache:
+        if tier_name in self._region_indexes:
+            region_index = self._region_indexes[tier_name]
+            if region_index is None:
+                region_index = _RegionIndex(self.regions_cache[tier_name])
+                self._region_indexes[tier_name] = region_index
+            return region_index.first_containing(start, end)
+        elif tier_name in self.regions_cache:
             for s, e in self.regions_cache[tier_name]:
                 if s <= start and e >= end:
                     return self.regions_cache[tier_name][(s, e)]
         else:
-            for t in self.tree.findall("TIER"):
+            for t in self._tiers:
                 if t.attrib['TIER_ID'] == tier_name:
-                    for a in t.findall("ANNOTATION/*"):
+                    for a, _ in self._annotation_elements(t):
                         annotation_regions = \
                             [self.time_order[a.attrib['TIME_SLOT_REF1']],
                              self.time_order[a.attrib['TIME_SLOT_REF2']]]
@@ -267,12 +445,7 @@ class Parser(poioapi.io.graf.BaseParser):
 
         """
 
-        for l in self.tree.findall("LINGUISTIC_TYPE"):
-            if l.attrib["LINGUISTIC_TYPE_ID"] == tier.linguistic_type:
-                if l.attrib['TIME_ALIGNABLE'] == 'true':
-                    return True
-
-        return False
+        return self._time_alignable.get(tier.linguistic_type, False)
 
     def get_primary_data(self):
         """This method gets the information about
@@ -328,7 +501,7 @@ class Parser(poioapi.io.graf.BaseParser):
         # -1.
 
         time_order = self.tree.find('TIME_ORDER')
-        time_order_dict = dict()
+        time_order_dict = collections.OrderedDict()
 
         for idx, time in enumerate(time_order):
             key = time.attrib['TIME_SLOT_ID']
@@ -368,14 +541,41 @@ class Parser(poioapi.io.graf.BaseParser):
 
         """
 
+        range_time_slots = None
         for time_slot, value in time_order_dict.items():
             if value is None:
+                if range_time_slots is None:
+                    range_time_slots = self._range_time_slots()
                 time_order_dict[time_slot] = self._find_time_slot_value(
-                    time_slot, time_order_dict)
+                    time_slot, time_order_dict, range_time_slots)
 
         return time_order_dict
 
-    def _find_time_slot_value(self, time_slot, time_order_dict):
+    def _range_time_slots(self):
+        """Helper function that maps each time slot to the time slots
+        that are used together with it in an alignable annotation.
+
+        Returns
+        -------
+        range_time_slots : dict
+            A dictionary with the time slot's and sets of time slot's.
+
+        """
+
+        range_time_slots = collections.defaultdict(set)
+
+        for tier in self._tiers:
+            for annotation, _ in self._annotation_elements(tier):
+                if annotation.tag == 'ALIGNABLE_ANNOTATION':
+                    time_slot1 = annotation.attrib['TIME_SLOT_REF1']
+                    time_slot2 = annotation.attrib['TIME_SLOT_REF2']
+                    range_time_slots[time_slot1].add(time_slot2)
+                    range_time_slots[time_slot2].add(time_slot1)
+
+        return range_time_slots
+
+    def _find_time_slot_value(self, time_slot, time_order_dict,
+                              range_time_slots):
         """Helper function to find and calculate the missing
         time value. The calculation is made base in the range
         where the time slot is used. The First it's obtain the
@@ -389,6 +589,9 @@ class Parser(poioapi.io.graf.BaseParser):
             Id of a "TIME_ORDER".
         time_order_dict : dict
             A dictonary with the time slot's and their values.
+        range_time_slots : dict
+            A dictionary with the time slot's that are used together in
+            an annotation, see `_range_time_slots`.
 
         Returns
         -------
@@ -397,30 +600,15 @@ class Parser(poioapi.io.graf.BaseParser):
 
         """
 
-        tiers = self.tree.findall('TIER')
-        range_time_slots = []
-
-        for tier in tiers:
-            annotations = tier.findall('ANNOTATION')
-            for annotation in annotations:
-                if annotation[0].tag == 'ALIGNABLE_ANNOTATION':
-                    if annotation[0].attrib['TIME_SLOT_REF1'] == time_slot:
-                        range_time_slots.append(
-                            annotation[0].attrib['TIME_SLOT_REF2'])
-                    if annotation[0].attrib['TIME_SLOT_REF2'] == time_slot:
-                        range_time_slots.append(
-                            annotation[0].attrib['TIME_SLOT_REF1'])
-
         time_slot_value = 0
-        range_time_slots = list(set(range_time_slots))
         count_values = 0
-        for time_slot in range_time_slots:
-            if time_order_dict[time_slot] != None:
-                time_slot_value += time_order_dict[time_slot]
-                count_values = 0
+        for range_time_slot in range_time_slots.get(time_slot, ()):
+            if time_order_dict[range_time_slot] is not None:
+                time_slot_value += time_order_dict[range_time_slot]
+                count_values += 1
 
         if count_values != 0:
-            time_slot_value = (time_slot_value / count_values)
+            time_slot_value = time_slot_value // count_values
 
         return time_slot_value
 
@@ -496,37 +684,63 @@ class Writer(poioapi.io.graf.BaseWriter):
 
         self._time_slot_id = 0
         self.time_order = self._map_time_slots(converter.meta_information)
+        self._tier_table = getattr(converter, 'tier_table', None)
+        if self._tier_table is None:
+            self._tier_table = poioapi.io.graf.TierTable()
+        self._previous_annotations = dict()
+        self._parents_with_previous = set()
+
+        tiers = self._flatten_hierarchy_elements(converter.tier_hierarchies)
+        meta_tiers = self._tiers_in_meta_information(
+            converter.meta_information)
+        nodes_for_tier = self._nodes_for_tiers(converter.graf, tiers)
 
-        for tier in self._flatten_hierarchy_elements(
-                converter.tier_hierarchies):
-            element = self._tier_in_meta_information(tier,
-                converter.meta_information)
+        for tier in tiers:
+            element = meta_tiers.get(
+                tier.split(poioapi.io.graf.GRAFSEPARATOR)[1])
             if element is not None:
-                for node in converter.graf.nodes:
-                    if node.id.startswith("{0}..".format(tier)):
-                        for ann in node.annotations:
+                for node in nodes_for_tier[tier]:
+                    for ann in node.annotations:
 
-                            annotation_value, ann_type, features = \
-                                self.get_annotation_values(node, ann)
+                        annotation_value, ann_type, features = \
+                            self.get_annotation_values(node, ann)
 
-                            annotation_element = SubElement(
-                                element, 'ANNOTATION')
-                            new_ann = SubElement(
-                                annotation_element, ann_type, features)
-                            SubElement(
-                                new_ann, 'ANNOTATION_VALUE').text = \
-                                annotation_value
+                        annotation_element = SubElement(
+                            element, 'ANNOTATION')
+                        new_ann = SubElement(
+                            annotation_element, ann_type, features)
+                        SubElement(
+                            new_ann, 'ANNOTATION_VALUE').text = \
+                            annotation_value
 
         self._write_file(outputfile, converter.primary_data,
             converter.meta_information)
 
-    def _tier_in_meta_information(self, tier, meta_information):
+    def _tiers_in_meta_information(self, meta_information):
+        """Map the tier names to the first TIER element with that name in
+        the meta information.
+
+        """
+        tiers = dict()
         for et in meta_information.findall("TIER"):
-            if et.attrib["TIER_ID"] == tier.split(
-                    poioapi.io.graf.GRAFSEPARATOR)[1]:
-                return et
+            tiers.setdefault(et.attrib["TIER_ID"], et)
 
-        return None
+        return tiers
+
+    def _nodes_for_tiers(self, graph, tiers):
+        """Group the nodes of the graph by the given tiers in one pass. A
+        node belongs to a tier if its ID starts with the tier and a
+        separator, so a node may belong to several tiers.
+
+        """
+        nodes_for_tier = dict((tier, []) for tier in tiers)
+        for node in graph.nodes:
+            code = self._tier_table.code_for_node(node)
+            for name in self._tier_table.names[code]:
+                if name in nodes_for_tier:
+                    nodes_for_tier[name].append(node)
+
+        return nodes_for_tier
 
     def get_annotation_values(self, node, ann):
         features = {'ANNOTATION_ID': ann.id}
@@ -573,14 +787,20 @@ class Writer(poioapi.io.graf.BaseWriter):
     def _find_previous_annotation(self, node):
         parent = node.parent
 
-        prev_node = None
-        neighbours = [child for child in parent.iter_children()
-                            if child.id.startswith(node.id.rpartition(
-                                poioapi.io.graf.GRAFSEPARATOR)[0])]
-        for neighbour in neighbours:
-            if neighbour.id == node.id:
-                break
-            prev_node = neighbour
+        if parent.id not in self._parents_with_previous:
+            # link all children of the parent to their previous sibling on
+            # the same tier
+            self._parents_with_previous.add(parent.id)
+            last_child = dict()
+            for child in parent.iter_children():
+                tier_code = self._tier_table.code_for_node(child)
+                key = (parent.id, child.id)
+                if key not in self._previous_annotations:
+                    self._previous_annotations[key] = \
+                        last_child.get(tier_code)
+                last_child[tier_code] = child
+
+        prev_node = self._previous_annotations[(parent.id, node.id)]
         if prev_node:
             return prev_node.annotations.get_first().id
 
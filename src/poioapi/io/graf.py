@@ -16,19 +16,184 @@ SAX Xml module.
 from __future__ import absolute_import, unicode_literals
 
 import abc
+import array
 import codecs
+import collections
+import mmap
+import multiprocessing
+import multiprocessing.pool
 import os
+import shutil
+import sys
+import threading
+import xml.sax
 
 from xml.etree.ElementTree import tostring
 from xml.dom import minidom
 
 import graf
+import graf.io
+
+import poioapi.io.stats
 
 # GrAF ID's separator
 GRAFSEPARATOR = ".."
 (TEXT, AUDIO, VIDEO, NONE) = ("text", "audio", "video", "none")
 
 
+def _int64_typecode():
+    # 'q' is only available since Python 3.3, before that 'l' has 8 bytes
+    # on most 64-bit platforms
+    for typecode in ('q', 'l'):
+        try:
+            if array.array(str(typecode)).itemsize == 8:
+                return str(typecode)
+        except ValueError:
+            pass
+    return None
+
+# typecode of the arrays of 64-bit integers, None if there is none
+INT64_TYPECODE = _int64_typecode()
+
+
+def int64_array(values=()):
+    """Return an array of 64-bit integers. If the platform has no array
+    type with 8 byte items, a list is returned.
+
+    Parameters
+    ----------
+    values : iterable of int
+        The initial values of the array.
+
+    Returns
+    -------
+    array : array.array or list
+
+    """
+
+    if INT64_TYPECODE is None:
+        return list(values)
+    return array.array(INT64_TYPECODE, values)
+
+
+def tier_prefixes(element_id):
+    """Return all the tier names that an element ID starts with. An ID like
+    "words..W-Words..na5" belongs to the tiers "words" and "words..W-Words",
+    i.e. to every prefix that is followed by the GrAF separator.
+
+    Parameters
+    ----------
+    element_id : str
+        The ID of a node, edge or region.
+
+    Returns
+    -------
+    prefixes : list of str
+        The tier names, shortest first.
+
+    """
+
+    prefixes = []
+    i = element_id.find(GRAFSEPARATOR)
+    while i != -1:
+        prefixes.append(element_id[:i])
+        i = element_id.find(GRAFSEPARATOR, i + 1)
+    return prefixes
+
+
+class TierTable(object):
+    """Interned integer codes for the tiers of the nodes in a graph. The tier
+    of a node is the part of its ID before the last GrAF separator, e.g.
+    "words..W-Words" for the node "words..W-Words..na5". Each tier is stored
+    once together with the tier names it belongs to (see `tier_prefixes`).
+
+    The GrAFConverter stores the code of its tier in the attribute
+    `tier_code` of each node it creates, so the tier of these nodes is found
+    without looking at their IDs. The codes are only valid for the table of
+    the converter that created the nodes.
+
+    """
+
+    def __init__(self):
+        self.tiers = []
+        self.names = []
+        self._codes = {}
+
+    def __len__(self):
+        return len(self.tiers)
+
+    def code(self, tier):
+        """Return the code of a tier, a new code is assigned to new tiers.
+
+        Parameters
+        ----------
+        tier : str
+            The tier, e.g. "words..W-Words".
+
+        Returns
+        -------
+        code : int
+
+        """
+        try:
+            return self._codes[tier]
+        except KeyError:
+            code = len(self.tiers)
+            self.tiers.append(tier)
+            self.names.append(tuple(name for name in
+                tier_prefixes(tier + GRAFSEPARATOR) if len(name) <= len(tier)))
+            self._codes[tier] = code
+            return code
+
+    def code_for_id(self, element_id):
+        """Return the code of the tier of a node, edge or region ID.
+
+        Parameters
+        ----------
+        element_id : str
+            The ID, e.g. "words..W-Words..na5".
+
+        Returns
+        -------
+        code : int
+
+        """
+        return self.code(element_id[:max(element_id.rfind(GRAFSEPARATOR), 0)])
+
+    def names_for_id(self, element_id):
+        """Return the tier names of a node, edge or region ID. The result is
+        the same as `tier_prefixes(element_id)`.
+
+        """
+        return self.names[self.code_for_id(element_id)]
+
+    def code_for_node(self, node):
+        """Return the code of the tier of a node. The stored `tier_code` of
+        the node is used if there is one, otherwise the code is taken from
+        the ID of the node.
+
+        Parameters
+        ----------
+        node : graf.Node
+            The node.
+
+        Returns
+        -------
+        code : int
+
+        """
+        try:
+            return node.tier_code
+        except AttributeError:
+            return self.code_for_id(node.id)
+
+    def names_for_node(self, node):
+        """Return the tier names of a node, see `code_for_node`.
+
+        """
+        return self.names[self.code_for_node(node)]
+
+
 class Tier:
     """A list of tiers.
     The name is the tier unique identification.
@@ -59,6 +224,149 @@ class Annotation:
         self.features = features
 
 
+def worker_pool(processes, data=None):
+    """Create a pool of workers. The pool uses worker processes if the
+    start method of multiprocessing is "fork", the workers then share the
+    data of this process that was created before the pool. With other start
+    methods, like the default on Windows and Mac OS X, a pool of threads is
+    returned, as the graphs cannot be pickled. The start method is never
+    changed.
+
+    The data is passed to each worker when it starts, the tasks of the pool
+    get it with `worker_data`.
+
+    Parameters
+    ----------
+    processes : int
+        The number of workers.
+    data : object
+        The data the workers need for all tasks.
+
+    Returns
+    -------
+    pool : multiprocessing.pool.Pool
+
+    """
+    if hasattr(multiprocessing, "get_start_method"):
+        start_method = multiprocessing.get_start_method(allow_none=True) or \
+            multiprocessing.get_all_start_methods()[0]
+        use_processes = start_method == "fork"
+    else:
+        use_processes = sys.platform != "win32"
+
+    if use_processes:
+        return multiprocessing.Pool(processes, _init_worker, (data,))
+    return multiprocessing.pool.ThreadPool(processes, _init_worker, (data,))
+
+
+# the data of the pool of the current worker, each worker thread has its own
+_worker = threading.local()
+
+
+def _init_worker(data):
+    _worker.data = data
+
+
+def worker_data():
+    """Return the data of the pool that runs the current task, see
+    `worker_pool`.
+
+    """
+    return _worker.data
+
+
+# graf-python has no public API to add edges with their positions in bulk,
+# to read the position of the next edge or to add an edge to a graph
+# without appending it to the edge lists of its nodes. The functions below
+# are the only code that uses the private layout of graf.Graph, checked
+# against graf-python 0.3.1: the position of the next edge is stored in
+# `_edge_pos` and the edges are an IdDict.
+_GRAPH_HAS_EDGE_POSITION = hasattr(graf.Graph(), "_edge_pos") and \
+    isinstance(graf.Graph().edges, dict)
+
+
+def _check_graph_internals():
+    if not _GRAPH_HAS_EDGE_POSITION:
+        raise RuntimeError(
+            "This version of graf-python is not supported, the graph has no "
+            "position of the next edge.")
+
+
+def next_edge_position(graph):
+    """Return the position that the graph gives to the next edge.
+
+    """
+    _check_graph_internals()
+    return graph._edge_pos
+
+
+def append_edges(graph, edges):
+    """Add edges to the graph and to the edge lists of their nodes. The
+    edges get the next positions of the graph, like edges that are created
+    with `graph.create_edge`.
+
+    """
+    _check_graph_internals()
+    for edge in edges:
+        edge.pos = graph._edge_pos
+        graph._edge_pos += 1
+        graph.edges.add(edge)
+
+
+def restore_edges(graph, edges, edge_position):
+    """Add edges to the graph without adding them to the edge lists of their
+    nodes, and set the position of the next edge. This restores a graph
+    whose nodes get their edge lists in the original order separately.
+
+    """
+    _check_graph_internals()
+    for edge in edges:
+        dict.__setitem__(graph.edges, edge.id, edge)
+    graph._edge_pos = edge_position
+
+
+def _render_file(position):
+    """Render the file at the given position of the files of the pool.
+
+    """
+    filename, out_graf = worker_data()[position]
+    graf.GrafRenderer(filename).render(out_graf)
+
+
+def tier_hierarchies_for_pairs(tiers_parent_list):
+    """Build the tier hierarchies from a list of (tier, parent tier) pairs.
+    Each pair with a parent tier None starts a new hierarchy. A tier is
+    appended as a new list to every list of the current hierarchy that
+    starts with its parent tier.
+
+    Parameters
+    ----------
+    tiers_parent_list : list of tuple
+        The (tier, parent tier) pairs, a parent tier before its children.
+
+    Returns
+    -------
+    tier_hierarchies : list
+        The tier hierarchies as nested lists.
+
+    """
+    tier_hierarchies = []
+    lists_for_tier = {}
+
+    for tier, parent_tier in tiers_parent_list:
+        if parent_tier is None:
+            hierarchy = [tier]
+            tier_hierarchies.append(hierarchy)
+            lists_for_tier = { tier: [hierarchy] }
+        else:
+            for parent_list in list(lists_for_tier.get(parent_tier, [])):
+                tiers_list = [tier]
+                parent_list.append(tiers_list)
+                lists_for_tier.setdefault(tier, []).append(tiers_list)
+
+    return tier_hierarchies
+
+
 class NodeId:
     """A list of nodes using a specific format.
     The prefix is the node type and the index
@@ -82,16 +390,145 @@ class NodeId:
         return "{0}{1}r{2}".format(self.prefix, GRAFSEPARATOR, self.index)
 
 
-class PrimaryData:
+class PrimaryData(object):
     """This class represents the primary data of an AnnotationGraph object.
 
+    The primary text is either stored as string in `content` or in a UTF-8
+    encoded file that is set with `set_content_file`. A content file is
+    memory-mapped when the text of a region is requested with
+    `text_for_region`, only the bytes of the region are read and decoded.
+
     """
 
+    # the number of characters between two entries of the character offset
+    # index of a content file
+    CHECKPOINT_CHARACTERS = 4096
+
     def __init__(self):
         self.type = None
         self.external_link = None
         self.filename = None
-        self.content = None
+        self.content_file = None
+        self._content = None
+        self._file = None
+        self._map = None
+        self._byte_offsets = None
+
+    @property
+    def content(self):
+        """The full primary text. For a content file the whole file is read,
+        use `text_for_region` to get parts of the text.
+
+        """
+        if self.content_file is not None:
+            with codecs.open(self.content_file, 'r', 'utf-8') as f:
+                return f.read()
+        return self._content
+
+    @content.setter
+    def content(self, content):
+        self.close()
+        self.content_file = None
+        self._content = content
+
+    def set_content_file(self, content_file):
+        """Use a UTF-8 encoded text file as primary text.
+
+        Parameters
+        ----------
+        content_file : str
+            The path to the text file.
+
+        """
+        self.close()
+        self._content = None
+        self.content_file = content_file
+
+    def text_for_region(self, start, end):
+        """Return the primary text between two character offsets.
+
+        Parameters
+        ----------
+        start : int
+            The offset of the first character.
+        end : int
+            The offset after the last character.
+
+        Returns
+        -------
+        text : str
+
+        """
+        if self.content_file is None:
+            if self._content is None:
+                return None
+            return self._content[start:end]
+
+        if self._map is None:
+            self._open_map()
+        if self._map is None or end <= start:
+            return ""
+
+        # start at the closest indexed character before the region, there is
+        # at most 4 bytes per character in UTF-8
+        checkpoint = min(start // self.CHECKPOINT_CHARACTERS,
+            len(self._byte_offsets) - 1)
+        skip = start - checkpoint * self.CHECKPOINT_CHARACTERS
+        byte_start = self._byte_offsets[checkpoint]
+        data = self._map[byte_start:byte_start + 4 * (skip + end - start)]
+
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        return decoder.decode(data)[skip:skip + end - start]
+
+    def _open_map(self):
+        self._file = open(self.content_file, 'rb')
+        if os.fstat(self._file.fileno()).st_size == 0:
+            # empty files cannot be mapped
+            self._file.close()
+            self._file = None
+            return
+
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # the byte offset of every CHECKPOINT_CHARACTERS-th character
+        self._byte_offsets = int64_array([0])
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        block_size = 16 * self.CHECKPOINT_CHARACTERS
+        position = 0
+        # the index of the next checkpoint in the text of the current block
+        checkpoint = self.CHECKPOINT_CHARACTERS
+        while position < len(self._map):
+            block = self._map[position:position + block_size]
+            text = decoder.decode(block)
+            # the bytes of an incomplete character at the end of the block
+            # are decoded again with the next block
+            pending = len(decoder.getstate()[0])
+            decoder.reset()
+            if pending == len(block):
+                # an incomplete character at the end of the file
+                break
+
+            byte_offset = position
+            previous = 0
+            while checkpoint <= len(text):
+                byte_offset += len(text[previous:checkpoint].encode('utf-8'))
+                self._byte_offsets.append(byte_offset)
+                previous = checkpoint
+                checkpoint += self.CHECKPOINT_CHARACTERS
+            checkpoint -= len(text)
+            position += len(block) - pending
+
+    def close(self):
+        """Close the memory map of the content file.
+
+        """
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._byte_offsets = None
 
 
 class BaseParser(object):
@@ -277,6 +714,24 @@ class BaseWriter(object):
 
         raise NotImplementedError("Method must be implemented")
 
+    def write_records(self, outputfile, records):
+        """Method that will write a sequence of records into a specific
+        format. Each record is an AnnotationGraph with the annotations of one
+        root annotation, as returned by AnnotationGraph.iter_records(). A
+        writer that supports streaming writes each record as soon as it gets
+        it, so that only one record is kept in memory.
+
+        Parameters
+        ----------
+        outputfile : str
+            The filename of the output file.
+        records : iterable of AnnotationGraph
+            The records that will be written.
+
+        """
+
+        raise NotImplementedError("Streaming is not supported by this writer")
+
 class GrAFConverter:
     """This class handles the conversion of different file formats into GrAF
     objects and back again. It uses a sub-class of BaseParser to get the
@@ -286,20 +741,37 @@ class GrAFConverter:
     output file format can store all meta-data from the input file format.
     In any case all the data and annotation will be stored.
 
+    If a poioapi.io.stats.ConversionStats object is given as `stats`, the
+    converter records the time of the conversion and writing and the number
+    of nodes, edges and regions for each tier.
+
+    If `lazy` is True, `parse` only reads the tier hierarchies. The nodes of a
+    tier are added to the graph the first time `load_tier` is called for the
+    tier or one of its child tiers. The parser is kept until all tiers are
+    loaded.
+
     """
 
-    def __init__(self, parser, writer=None):
+    def __init__(self, parser, writer=None, lazy=False, stats=None):
         self.parser = parser
         self.writer = writer
+        self.lazy = lazy
+        self.stats = stats
         self.graf = graf.Graph()
         self.tier_hierarchies = []
         self.meta_information = None
         self.primary_data = None
         self.original_file = None
+        self.tier_table = TierTable()
+        self._lazy_tiers = collections.OrderedDict()
+        self._lazy_tiers_for_name = collections.defaultdict(list)
+        self._tier_contexts = {}
 
     def write(self, outputfile):
         if self.writer:
-            self.writer.write(outputfile, self)
+            self.load_all_tiers()
+            with poioapi.io.stats.phase(self.stats, 'write'):
+                self.writer.write(outputfile, self)
 
     def parse(self):
         """This method will be the responsible to transform
@@ -308,25 +780,82 @@ class GrAFConverter:
 
         """
 
-        self._tiers_parent_list = []
-        self.root_tiers = []
-        tiers_hierarchy_map = {}
+        with poioapi.io.stats.phase(self.stats, 'convert'):
+            self._init_parse()
+
+            for tier in self.parser.get_root_tiers():
+                self.root_tiers.append(tier.name)
+                if self.lazy:
+                    self._register_tier(tier)
+                else:
+                    self._convert_tier(tier)
+
+            self._finish_parse()
+
+    def iter_records(self):
+        """Parse the input record by record. A record is one annotation of a
+        root tier together with all annotations below it. For each record a
+        new graf.Graph is created and returned, so only the graph of one
+        record is kept in memory at a time. If the parser has a method
+        iter_records(), that returns the root tier and the annotation of
+        each record, the records are read from the parser one at a time.
+        Otherwise the annotations of the root tiers are requested from the
+        parser, which then holds the whole input. The tier hierarchies, the
+        meta information and the primary data are set before the first
+        record is returned.
+
+        Returns
+        -------
+        records : generator of graf.Graph
+            The graphs of the records in the order of the parser.
+
+        """
+
+        self._init_parse()
 
-        for tier in self.parser.get_root_tiers():
+        root_tiers = self.parser.get_root_tiers()
+        for tier in root_tiers:
             self.root_tiers.append(tier.name)
-            self._convert_tier(tier, None, None)
+            self._register_tier(tier)
 
-        i = 0
-        for t in self._tiers_parent_list:
-            if t[1] is None:
-                i += 1
-                tiers_hierarchy_map[str(i)] = [t[0]]
-            else:
-                self._append_tier_to_hierarchy(tiers_hierarchy_map[str(i)],
-                    t[1], t[0])
+        self._finish_parse()
 
-        for i, hierarchy in tiers_hierarchy_map.items():
-            self.tier_hierarchies.append(hierarchy)
+        if hasattr(self.parser, 'iter_records'):
+            records = self.parser.iter_records()
+        else:
+            records = self._root_annotations(root_tiers)
+
+        for tier, annotation in records:
+            self.graf = graf.Graph()
+            self.tier_table = TierTable()
+            with poioapi.io.stats.phase(self.stats, 'convert'):
+                if annotation is None:
+                    self._convert_tier(tier)
+                else:
+                    self._convert_tier(tier, [annotation])
+            yield self.graf
+
+    def _root_annotations(self, root_tiers):
+        for tier in root_tiers:
+            annotations = self.parser.get_annotations_for_tier(tier)
+            if annotations == []:
+                # the child tiers are converted without parents
+                annotations = [None]
+
+            for annotation in annotations:
+                yield (tier, annotation)
+
+    def _init_parse(self):
+        self._tiers_parent_list = []
+        self._tiers_parent_set = set()
+        self.root_tiers = []
+
+        self._child_tiers = {}
+        self._has_regions = {}
+
+    def _finish_parse(self):
+        self.tier_hierarchies.extend(
+            tier_hierarchies_for_pairs(self._tiers_parent_list))
 
         if hasattr(self.parser, 'meta_information'):
             self.meta_information = self.parser.meta_information
@@ -336,10 +865,11 @@ class GrAFConverter:
                 isinstance(self.parser.filepath, str):
             self.original_file = os.path.abspath(self.parser.filepath)
 
-    def _convert_tier(self, tier, parent_node, parent_annotation,
-            parent_prefix=None):
-        child_tiers = self.parser.get_child_tiers_for_tier(tier)
+    def _tier_prefix(self, tier):
+        """Return the prefix of the node IDs and the annotation space name
+        of a tier.
 
+        """
         if tier.annotation_space is None:
             prefix = tier.name
             annotation_name = prefix
@@ -349,102 +879,324 @@ class GrAFConverter:
             prefix = "{0}{1}{2}".format(annotation_name, GRAFSEPARATOR,
                 tier.name)
 
-        has_regions = False
+        return prefix, annotation_name
 
-        if self.parser.tier_has_regions(tier):
-            has_regions = True
+    def _register_tier(self, tier, parent_prefix=None):
+        """Add a tier and its child tiers to the tier hierarchy without
+        converting their annotations. This is the first step of the lazy
+        conversion and of the conversion record by record.
 
+        """
+        prefix, _ = self._tier_prefix(tier)
         self._add_tier_in_hierarchy_list(prefix, parent_prefix)
 
-        annotations = self.parser.get_annotations_for_tier(tier,
-            parent_annotation)
+        if self.lazy and prefix not in self._lazy_tiers:
+            self._lazy_tiers[prefix] = (tier, parent_prefix)
+            for tier_name in tier_prefixes(prefix + GRAFSEPARATOR):
+                self._lazy_tiers_for_name[tier_name].append(prefix)
 
-        for annotation in annotations:
-            regions = None
+        for t in self._child_tiers_for_tier(tier, prefix):
+            self._register_tier(t, prefix)
 
-            if has_regions:
-                regions = self.parser.region_for_annotation(annotation)
+    def load_tier(self, tier_name):
+        """Add the nodes of all tiers that belong to the given tier name to
+        the graph, if they were not loaded yet. The parent tiers are loaded
+        first. The tier name may be an annotation space or a full tier
+        prefix, like in `AnnotationGraph.nodes_for_tier`.
 
-            node_id = NodeId(prefix, annotation.id)
-            self._add_node(node_id, annotation, annotation_name, regions,
-                parent_node)
-            self._add_root_nodes(prefix, node_id)
+        Parameters
+        ----------
+        tier_name : str
+            The name of the tier to load.
 
-            if child_tiers:
-                for t in child_tiers:
-                    self._convert_tier(t, node_id, annotation, prefix)
+        Returns
+        -------
+        nodes : list of graf.Node
+            The nodes that were added to the graph, in the order they were
+            added.
 
-        if annotations == [] and child_tiers:
-            for t in child_tiers:
-                self._convert_tier(t, None, None, prefix)
+        """
+        nodes = []
+        if not self._lazy_tiers:
+            return nodes
 
-    def _add_tier_in_hierarchy_list(self, prefix, parent_prefix):
-        if not (prefix, parent_prefix) in self._tiers_parent_list:
-            self._tiers_parent_list.append((prefix, parent_prefix))
+        for prefix in self._lazy_tiers_for_name.pop(tier_name, []):
+            if prefix in self._lazy_tiers:
+                self._load_tier(prefix, nodes)
+        return nodes
+
+    def load_all_tiers(self):
+        """Add the nodes of all tiers that were not loaded yet to the graph.
+
+        """
+        while self._lazy_tiers:
+            self._load_tier(next(iter(self._lazy_tiers)), [])
+
+        self._lazy_tiers_for_name.clear()
+        self._tier_contexts = {}
+
+    def _load_tier(self, prefix, nodes):
+        tier, parent_prefix = self._lazy_tiers[prefix]
+
+        # the parent contexts are the (parent graf.Node, parent annotation)
+        # pairs of the parent tier
+        if parent_prefix is None:
+            parent_contexts = [(None, None)]
+        else:
+            if parent_prefix in self._lazy_tiers:
+                self._load_tier(parent_prefix, nodes)
+            parent_contexts = self._tier_contexts[parent_prefix]
 
-    def _append_tier_to_hierarchy(self, tiers_list, parent_tier, tier):
-        for t in tiers_list:
-            if isinstance(t, list):
-                self._append_tier_to_hierarchy(t, parent_tier, tier)
+        del self._lazy_tiers[prefix]
+
+        contexts = self._convert_annotations(tier, parent_contexts)
+        self._tier_contexts[prefix] = contexts
+        nodes.extend(node for node, _ in contexts if node is not None)
+
+    def _convert_tier(self, tier, annotations=None):
+        """Convert a root tier and all of its child tiers. The tiers are
+        converted one after the other, a parent tier before its child tiers,
+        in the order of the tier hierarchy. If a list of annotations is
+        given, only these annotations of the root tier are converted.
+
+        """
+        prefix, _ = self._tier_prefix(tier)
+        self._add_tier_in_hierarchy_list(prefix, None)
+        contexts = self._convert_annotations(tier, [(None, None)],
+                                             annotations)
+
+        # each entry is a tier, the prefix of its parent tier and the
+        # (parent graf.Node, parent annotation) pairs of the parent tier
+        stack = [(t, prefix, contexts) for t in
+                 reversed(self._child_tiers_for_tier(tier, prefix))]
+        while stack:
+            tier, parent_prefix, parent_contexts = stack.pop()
+            prefix, _ = self._tier_prefix(tier)
+            self._add_tier_in_hierarchy_list(prefix, parent_prefix)
+
+            contexts = self._convert_annotations(tier, parent_contexts)
+
+            for t in reversed(self._child_tiers_for_tier(tier, prefix)):
+                stack.append((t, prefix, contexts))
+
+    def _child_tiers_for_tier(self, tier, prefix):
+        try:
+            return self._child_tiers[prefix]
+        except KeyError:
+            child_tiers = self.parser.get_child_tiers_for_tier(tier) or []
+            self._child_tiers[prefix] = child_tiers
+            return child_tiers
+
+    def _tier_has_regions(self, tier, prefix):
+        try:
+            return self._has_regions[prefix]
+        except KeyError:
+            has_regions = bool(self.parser.tier_has_regions(tier))
+            self._has_regions[prefix] = has_regions
+            return has_regions
+
+    def _convert_annotations(self, tier, parent_contexts, annotations=None):
+        """Add the nodes of a tier to the graph. For each parent context the
+        annotations are requested from the parser. The nodes, edges, regions
+        and annotations of the whole tier are then added to the graph.
+
+        Parameters
+        ----------
+        tier : Tier
+            The tier to convert.
+        parent_contexts : list of tuple
+            The (parent graf.Node, parent annotation) pairs of the parent
+            tier.
+        annotations : list of Annotation
+            The annotations of the tier for a single parent context. If None
+            the annotations are requested from the parser.
+
+        Returns
+        -------
+        contexts : list of tuple
+            The (graf.Node, annotation) pairs of the tier, in the order of
+            the nodes. A parent context without annotations adds the pair
+            (None, None), the child tiers are then converted without a
+            parent.
+
+        """
+        prefix, annotation_name = self._tier_prefix(tier)
+        has_regions = self._tier_has_regions(tier, prefix)
+        node_prefix = "{0}{1}n".format(prefix, GRAFSEPARATOR)
+        tier_code = self.tier_table.code(prefix)
+        region_prefix = "{0}{1}r".format(prefix, GRAFSEPARATOR)
+
+        contexts = []
+        nodes = []
+        edges = []
+        regions = []
+        graf_annotations = []
+        for parent_node, parent_annotation in parent_contexts:
+            if annotations is None:
+                tier_annotations = self.parser.get_annotations_for_tier(tier,
+                    parent_annotation)
             else:
-                if t == parent_tier:
-                    tiers_list.append([tier])
+                tier_annotations = annotations
+
+            if tier_annotations == []:
+                contexts.append((None, None))
+                continue
+
+            for annotation in tier_annotations:
+                index = str(annotation.id)
+                node = graf.Node(node_prefix + index)
+                node.tier_code = tier_code
+
+                if parent_node is not None:
+                    edges.append(graf.Edge("e" + index, parent_node, node))
 
-    def _add_node(self, node_id, annotation, annotation_name, regions,
-            from_node_id):
-        self._add_node_to_graph(node_id, regions, from_node_id)
-        self._add_graf_annotation(annotation_name, annotation.id, node_id,
-                                  annotation.value, annotation.features)
+                if has_regions:
+                    anchors = self.parser.region_for_annotation(annotation)
+                    if anchors is not None:
+                        region = graf.Region(region_prefix + index, *anchors)
+                        node.add_region(region)
+                        regions.append(region)
+
+                graf_annotation = graf.Annotation(annotation_name,
+                    annotation.features, annotation.id)
+                if annotation.value is not None:
+                    graf_annotation.features['annotation_value'] = \
+                        annotation.value
+                node.annotations.add(graf_annotation)
+                graf_annotations.append(graf_annotation)
+
+                nodes.append(node)
+                contexts.append((node, annotation))
+
+        self._add_tier_nodes(prefix, annotation_name, nodes, edges, regions,
+            graf_annotations)
+
+        return contexts
+
+    def _add_tier_nodes(self, prefix, annotation_name, nodes, edges,
+            regions, annotations):
+        graph = self.graf
+
+        for node in nodes:
+            graph.nodes.add(node)
+
+        append_edges(graph, edges)
+
+        for region in regions:
+            graph.regions.add(region)
+
+        if annotations:
+            if annotation_name in graph.annotation_spaces:
+                annotation_space = graph.annotation_spaces[annotation_name]
+            else:
+                annotation_space = graf.AnnotationSpace(annotation_name)
+                graph.annotation_spaces.add(annotation_space)
+            for annotation in annotations:
+                annotation_space.add(annotation)
 
-    def _add_root_nodes(self, prefix, node_id):
         if prefix in self.root_tiers:
-            self.graf.header.roots.append(node_id.to_str())
+            graph.header.roots.extend(node.id for node in nodes)
 
-    def _add_graf_annotation(self, annotation_name, annotation_id,
-            annotation_ref, annotation_value, annotation_features=None):
-        annotation = graf.Annotation(annotation_name, annotation_features,
-                                     annotation_id)
+        if self.stats is not None:
+            self.stats.count(prefix, len(nodes), len(edges), len(regions))
+            self.stats.peak('nodes', len(graph.nodes))
+            self.stats.peak('edges', len(graph.edges))
+            self.stats.peak('regions', len(graph.regions))
 
-        if annotation_value is not None:
-            annotation.features['annotation_value'] = annotation_value
+    def _add_tier_in_hierarchy_list(self, prefix, parent_prefix):
+        if not (prefix, parent_prefix) in self._tiers_parent_set:
+            self._tiers_parent_set.add((prefix, parent_prefix))
+            self._tiers_parent_list.append((prefix, parent_prefix))
 
-        self.graf.nodes[annotation_ref.to_str()].annotations.add(annotation)
 
-        if annotation_name in self.graf.annotation_spaces:
-            #if annotation not in self.graf.annotation_spaces[annotation_name]:
-            self.graf.annotation_spaces[annotation_name].add(annotation)
-        else:
-            annotation_space = graf.AnnotationSpace(annotation_name)
-            annotation_space.add(annotation)
+class GrAFLoader(object):
+    """Loads the annotation space files of a GrAF/XML document into a graph
+    one at a time. The files that an annotation space depends on are loaded
+    before the annotation space. An object of this class can be used as
+    `tier_loader` of an AnnotationGraph, then the annotation spaces are
+    loaded the first time their nodes are requested.
+
+    Parameters
+    ----------
+    headerfile : str
+        The path to the header file of the GrAF/XML document, with the
+        extension ".hdr".
+
+    """
+
+    def __init__(self, headerfile):
+        self.graf = graf.Graph()
+        self._locations = collections.OrderedDict()
+        self._loaded = set()
 
-            self.graf.annotation_spaces.add(annotation_space)
+        dirname = os.path.dirname(headerfile)
+        doc_header = minidom.parse(headerfile)
+        for annotation in doc_header.getElementsByTagName('annotation'):
+            self._locations[annotation.getAttribute('f.id')] = \
+                os.path.join(dirname, annotation.getAttribute('loc'))
 
-    def _add_node_to_graph(self, node_id, regions=None,
-                           from_node_id=None):
+    def load_annotation_space(self, annotation_space):
+        """Add the nodes of an annotation space and of the annotation
+        spaces it depends on to the graph, if they were not loaded yet.
 
-        node = graf.Node(node_id.to_str())
+        Parameters
+        ----------
+        annotation_space : str
+            The name of the annotation space, e.g. "words".
 
-        if from_node_id is not None:
-            edge_id = node_id.str_edge()
-            self.graf.create_edge(self.graf.nodes[from_node_id.to_str()], node,
-                edge_id)
+        """
+        if annotation_space in self._loaded or \
+                annotation_space not in self._locations:
+            return
+        self._loaded.add(annotation_space)
 
-        if regions is not None:
-            region_id = node_id.str_region()
-            region = graf.Region(region_id, *regions)
-            node.add_region(region)
+        parser = xml.sax.make_parser()
+        handler = graf.io.GraphHandler(parser, self.graf,
+            self._load_dependency)
+        parser.setContentHandler(handler)
+        parser.parse(self._locations[annotation_space])
 
-            self.graf.regions.add(region)
+    def _load_dependency(self, annotation_space, graph):
+        self.load_annotation_space(annotation_space)
 
-        self.graf.nodes.add(node)
+    def load_tier(self, tier_name):
+        """Load the annotation space of a tier name. The tier name may be an
+        annotation space or a full tier prefix, like in
+        `AnnotationGraph.nodes_for_tier`.
+
+        Parameters
+        ----------
+        tier_name : str
+            The name of the tier to load.
+
+        """
+        self.load_annotation_space(tier_name.split(GRAFSEPARATOR)[0])
+
+    def load_all_tiers(self):
+        """Load all annotation spaces that were not loaded yet, in the order
+        of the header file.
+
+        """
+        for annotation_space in self._locations:
+            self.load_annotation_space(annotation_space)
 
 
 class Writer(BaseWriter):
+    """Writes an AnnotationGraph as GrAF/XML files, one file for each
+    annotation space and a standoff header.
+
+    If `render_workers` is set to a number greater than 1, the files of the
+    annotation spaces are rendered by a pool of that many workers. The
+    standoff header is written when all files are rendered.
+
+    """
 
     def __init__(self, **kwargs):
         self.tier_hierarchies = None
         self.meta_information = None
+        self.render_workers = None
         self.standoffheader = graf.StandoffHeader(**kwargs)
+        self._tier_table = TierTable()
 
     def _flatten_hierarchy_elements(self, elements):
         """Flat the elements appended to a new list of elements.
@@ -485,48 +1237,121 @@ class Writer(BaseWriter):
 
         (basedirname, _) = os.path.splitext(outputfile)
 
+        if hasattr(ag, 'load_all_tiers'):
+            ag.load_all_tiers()
+
+        stats = getattr(ag, 'stats', None)
         self._get_parents(ag.tier_hierarchies)
 
+        self._tier_table = getattr(ag, 'tier_table', None)
+        if self._tier_table is None:
+            self._tier_table = TierTable()
+
+        # partition the graph in one pass, an edge belongs to the tier of its
+        # target node
+        nodes = self._partition(ag.graf.nodes, self._tier_for_node)
+        edges = self._partition(ag.graf.edges,
+            lambda e: self._tier_for_node(e.to_node))
+        regions = self._partition(ag.graf.regions,
+            lambda r: r.id.rsplit(GRAFSEPARATOR, 1)[0])
+        roots = {}
+        for root in ag.graf.header.roots:
+            roots.setdefault(root.split(GRAFSEPARATOR)[0], []).append(root)
+
         standoffrenderer = graf.StandoffHeaderRenderer("{0}.hdr".format(
             basedirname))
 
+        parallel = self.render_workers is not None and \
+            self.render_workers > 1
+        files = collections.OrderedDict()
+
         for tier_name in self._flatten_hierarchy_elements(
                 ag.tier_hierarchies):
             annotation_space = tier_name.split(GRAFSEPARATOR)[0]
             out_graf = graf.Graph()
-            renderer = graf.GrafRenderer("{0}-{1}.xml".format(
-                basedirname, annotation_space
-            ))
-            out_graf.nodes = [n for n in ag.graf.nodes
-                              if n.id.startswith(tier_name)]
-            out_graf.edges = [e for e in ag.graf.edges
-                              if e.to_node.id.startswith(tier_name)]
-            out_graf.regions = [r for r in ag.graf.regions
-                                if r.id.startswith(tier_name)]
+            filename = "{0}-{1}.xml".format(basedirname, annotation_space)
+            out_graf.nodes = nodes.get(tier_name, [])
+            out_graf.edges = edges.get(tier_name, [])
+            out_graf.regions = regions.get(tier_name, [])
             out_graf.annotation_spaces.add(graf.AnnotationSpace(
                 annotation_space))
             out_graf.header.add_dependency(self._parent[tier_name])
+            out_graf.header.roots.extend(roots.get(annotation_space, []))
 
-            out_graf = self._add_root_nodes(ag.graf, annotation_space,
-                out_graf)
-
-            renderer.render(out_graf)
+            if parallel:
+                # tiers of the same annotation space write the same file, the
+                # graph of the last tier is the one that is kept
+                files[filename] = out_graf
+            else:
+                with poioapi.io.stats.phase(stats, 'render'):
+                    graf.GrafRenderer(filename).render(out_graf)
 
             basename = os.path.basename(basedirname)
             self.standoffheader.datadesc.add_annotation(
                 "{0}-{1}.xml".format(basename, annotation_space),
                 annotation_space)
 
+        if parallel:
+            with poioapi.io.stats.phase(stats, 'render'):
+                self._render_parallel(list(files.items()))
+
         self._add_primary_data(ag.primary_data, basedirname)
         standoffrenderer.render(self.standoffheader)
-        self._generate_metafile(basedirname, ag.meta_information)
+        with poioapi.io.stats.phase(stats, 'metafile'):
+            self._generate_metafile(basedirname, ag.meta_information)
 
-    def _add_root_nodes(self, graph, annotation_space, out_graf):
-        for root in graph.header.roots:
-            if annotation_space in root:
-                out_graf.header.roots.append(root)
+    def _render_parallel(self, files):
+        """Render the files of the annotation spaces with a pool of
+        `render_workers` workers. Each file is written by one worker.
 
-        return out_graf
+        Parameters
+        ----------
+        files : list of tuple
+            The filename and the graf.Graph of each file.
+
+        """
+        pool = worker_pool(min(self.render_workers, len(files)), files)
+        try:
+            pool.map(_render_file, range(len(files)), 1)
+        finally:
+            pool.close()
+            pool.join()
+
+    def _tier_for_node(self, node):
+        """Return the tier of a node. For nodes without a tier code the
+        tier is the part of the ID before the last separator.
+
+        """
+        try:
+            return self._tier_table.tiers[node.tier_code]
+        except AttributeError:
+            return node.id.rsplit(GRAFSEPARATOR, 1)[0]
+
+    def _partition(self, elements, tier_for_element):
+        """Group elements by their tier, in the order of the elements.
+
+        Parameters
+        ----------
+        elements : iterable
+            The elements of a graph, e.g. nodes or edges.
+        tier_for_element : callable
+            A function that returns the tier of an element.
+
+        Returns
+        -------
+        partition : collections.OrderedDict
+            A list of elements for each tier, the tiers in the order of
+            their first element.
+
+        """
+        partition = collections.OrderedDict()
+        for element in elements:
+            tier_name = tier_for_element(element)
+            try:
+                partition[tier_name].append(element)
+            except KeyError:
+                partition[tier_name] = [element]
+        return partition
 
     def _get_parents(self, tier_hierarchies):
         self._parent = {}
@@ -547,6 +1372,9 @@ class Writer(BaseWriter):
     def _add_primary_data(self, primary_data, basedirname):
         if primary_data.external_link:
             loc = primary_data.external_link
+        elif primary_data.content_file is not None:
+            loc = self._copy_raw_txt_file(primary_data.content_file,
+                basedirname)
         elif primary_data.content:
             loc = self._create_raw_txt_file(primary_data.content, basedirname)
         elif primary_data.filename:
@@ -564,6 +1392,14 @@ class Writer(BaseWriter):
 
         return os.path.basename(filename)
 
+    def _copy_raw_txt_file(self, content_file, basedirname):
+        filename = "{0}.txt".format(os.path.splitext(basedirname)[0])
+        file = os.path.abspath(filename)
+        if file != os.path.abspath(content_file):
+            shutil.copyfile(content_file, file)
+
+        return os.path.basename(filename)
+
     def _generate_metafile(self, basedirname, meta_information=None):
         """Generate a metafile with all the extra information
         extracted from a file when it is parsed.
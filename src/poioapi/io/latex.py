@@ -318,7 +318,20 @@ class Writer(poioapi.io.graf.BaseWriter):
                 The temporary file name.
         """
         temp_file = codecs.open(temp_file_name, 'w', encoding='utf8')
+        self._write_root_nodes(converter, temp_file)
+        temp_file.close()
+
+    def _write_root_nodes(self, converter, temp_file):
+        """ Method that writes the latex body for the root nodes of a
+            converter to an open file.
 
+            Parameters
+            ----------
+            converter : poioapi.annotationgraph.AnnotationGraph
+                The node storage
+            temp_file : file
+                The open temporary file.
+        """
         root_nodes = converter.root_nodes()
 
         for node in root_nodes:
@@ -358,8 +371,6 @@ class Writer(poioapi.io.graf.BaseWriter):
 
             temp_file.write('\\z\n')
 
-        temp_file.close()
-
     def write(self, outputfile, converter):
         """ Method to write the latex document.
 
@@ -370,12 +381,46 @@ class Writer(poioapi.io.graf.BaseWriter):
             converter : poioapi.annotationgraph.AnnotationGraph
                 The node storage.
         """
-        self._output_stream = codecs.open(outputfile, 'w', encoding='utf8')
-
         #build the document body
         temp_file = outputfile + '.tmp'
         self._build_latex_body(converter, temp_file)
 
+        self._write_document(outputfile, temp_file)
+
+    def write_records(self, outputfile, records):
+        """ Method to write the latex document from a sequence of records,
+            as returned by AnnotationGraph.iter_records(). The body of each
+            record is written to the temporary file as soon as the record is
+            read, so only one record is kept in memory.
+
+            Parameters
+            ----------
+            ouputfile : str
+                The destination filepath.
+            records : iterable of poioapi.annotationgraph.AnnotationGraph
+                The node storages of the records.
+        """
+        temp_file_name = outputfile + '.tmp'
+        temp_file = codecs.open(temp_file_name, 'w', encoding='utf8')
+        for record in records:
+            self._write_root_nodes(record, temp_file)
+        temp_file.close()
+
+        self._write_document(outputfile, temp_file_name)
+
+    def _write_document(self, outputfile, temp_file):
+        """ Method to write the preamble and the body from the temporary
+            file to the final document.
+
+            Parameters
+            ----------
+            ouputfile : str
+                The destination filepath.
+            temp_file : str
+                The temporary file name.
+        """
+        self._output_stream = codecs.open(outputfile, 'w', encoding='utf8')
+
         #write the final document
         self._write_preamble()
 
@@ -13,9 +13,26 @@ structure in memors. The data that is stored is equivalent to a GrAF graph but
 without the overhead of Python objects. The AnnotationGraph object thus can be
 used wit memory or GrAF data storage.
 
+Each node is an integer. The tier of a node, its parent, its first child, its
+next sibling and its annotation value are stored in arrays. Tier names and
+annotation values are interned, so that each distinct string is only stored
+once. Node objects are only created when they are requested through
+`nodes_for_tier`, they are light-weight views on the arrays.
+
 """
 
-import redis
+from __future__ import absolute_import, unicode_literals
+
+import os
+import array
+import heapq
+
+import graf
+
+import poioapi.io.graf
+import poioapi.io.stats
+from poioapi.io.graf import GRAFSEPARATOR
+
 
 class MemoryConverter:
     """This class handles the conversion of different file formats into memory
@@ -24,41 +41,75 @@ class MemoryConverter:
 
     """
 
-    def __init__(self, parser, writer=None):
+    def __init__(self, parser, writer=None, stats=None):
         self.parser = parser
+        self.stats = stats
         self.tier_hierarchies = []
         self.meta_information = None
         self.primary_data = None
         self.original_file = None
-        self.annotations_for_parent = dict()
-        self.region_for_annotation = dict()
+        self.root_tiers = []
+
+        # interned tier prefixes and their annotation spaces
+        self.tiers = []
+        self.annotation_spaces = []
+        self._tier_codes = dict()
+        self._tier_codes_for_name = dict()
+
+        # interned annotation values
+        self.values = []
+        self._value_codes = dict()
+
+        # node arrays, the index in the arrays is the node
+        self.node_tier = array.array(str('i'))
+        self.node_parent = array.array(str('l'))
+        self.node_first_child = array.array(str('l'))
+        self.node_last_child = array.array(str('l'))
+        self.node_next_sibling = array.array(str('l'))
+        self.node_value = array.array(str('l'))
+        self.annotation_ids = []
+        self.node_features = dict()
+        self.node_regions = dict()
+        self.nodes_by_tier = []
+
+    def __len__(self):
+        return len(self.node_tier)
+
+    @property
+    def region_for_annotation(self):
+        """A dict that maps the annotation IDs to their regions. It is
+        created from the regions of the nodes on each access.
+
+        """
+        return dict((self.annotation_ids[node], region)
+                    for node, region in self.node_regions.items())
 
     def parse(self):
         """This method will be the responsible to transform
-        the parser into a redis key/value items. This method also
+        the parser into arrays of nodes. This method also
         retrieves and stores the tiers hierarchies.
 
         """
 
         self._tiers_parent_list = []
+        self._tiers_parent_set = set()
+        self._tier_positions = {}
         self.root_tiers = []
-        tiers_hierarchy_map = {}
 
-        for tier in self.parser.get_root_tiers():
-            self.root_tiers.append(tier.name)
-            self._convert_tier(tier, None)
+        with poioapi.io.stats.phase(self.stats, 'convert'):
+            for tier in self.parser.get_root_tiers():
+                self.root_tiers.append(tier.name)
+                self._convert_tier(tier, -1, None)
 
-        i = 0
-        for t in self._tiers_parent_list:
-            if t[1] is None:
-                i += 1
-                tiers_hierarchy_map[str(i)] = [t[0]]
-            else:
-                self._append_tier_to_hierarchy(tiers_hierarchy_map[str(i)],
-                    t[1], t[0])
+        del self._tier_positions
 
-        for i, hierarchy in tiers_hierarchy_map.items():
-            self.tier_hierarchies.append(hierarchy)
+        if self.stats is not None:
+            for tier_code, tier in enumerate(self.tiers):
+                self.stats.count(tier, len(self.nodes_by_tier[tier_code]))
+            self.stats.peak('nodes', len(self))
+
+        self.tier_hierarchies.extend(poioapi.io.graf.tier_hierarchies_for_pairs(
+            self._tiers_parent_list))
 
         if hasattr(self.parser, 'meta_information'):
             self.meta_information = self.parser.meta_information
@@ -68,7 +119,7 @@ class MemoryConverter:
                 isinstance(self.parser.filepath, str):
             self.original_file = os.path.abspath(self.parser.filepath)
 
-    def _convert_tier(self, tier, parent_annotation,
+    def _convert_tier(self, tier, parent_node, parent_annotation,
             parent_prefix=None):
         child_tiers = self.parser.get_child_tiers_for_tier(tier)
 
@@ -87,6 +138,7 @@ class MemoryConverter:
             has_regions = True
 
         self._add_tier_in_hierarchy_list(prefix, parent_prefix)
+        tier_code = self._tier_code(prefix, annotation_name)
 
         annotations = self.parser.get_annotations_for_tier(tier,
             parent_annotation)
@@ -96,82 +148,259 @@ class MemoryConverter:
 
             if has_regions:
                 region = self.parser.region_for_annotation(annotation)
-                self.region_for_annotation[annotation.id] = region
-
-            #node_id = NodeId(prefix, annotation.id)
-            parent_annotation_id = None
-            if parent_annotation is not None:
-                parent_annotation_id = parent_annotation.id
-            self.annotations_for_parent[(parent_annotation_id, tier.name)] = \
-                annotation
-            #self._add_node(node_id, annotation, annotation_name, regions,
-            #    parent_node)
-            #self._add_root_nodes(prefix, node_id)
+
+            node = self._add_node(tier_code, annotation, region, parent_node)
 
             if child_tiers:
                 for t in child_tiers:
-                    self._convert_tier(t, annotation, prefix)
+                    self._convert_tier(t, node, annotation, prefix)
 
         if annotations == [] and child_tiers:
             for t in child_tiers:
-                self._convert_tier(t, None, prefix)
+                self._convert_tier(t, -1, None, prefix)
 
     def _add_tier_in_hierarchy_list(self, prefix, parent_prefix):
-        if not (prefix, parent_prefix) in self._tiers_parent_list:
+        if not (prefix, parent_prefix) in self._tiers_parent_set:
+            self._tiers_parent_set.add((prefix, parent_prefix))
             self._tiers_parent_list.append((prefix, parent_prefix))
 
-    def _append_tier_to_hierarchy(self, tiers_list, parent_tier, tier):
-        for t in tiers_list:
-            if isinstance(t, list):
-                self._append_tier_to_hierarchy(t, parent_tier, tier)
+    def _tier_code(self, prefix, annotation_name):
+        if prefix in self._tier_codes:
+            return self._tier_codes[prefix]
+
+        tier_code = len(self.tiers)
+        self.tiers.append(prefix)
+        self.annotation_spaces.append(annotation_name)
+        self.nodes_by_tier.append(array.array(str('l')))
+        self._tier_codes[prefix] = tier_code
+
+        # the tier can be found by every prefix of its name, like the node
+        # IDs in a GrAF graph
+        for tier_name in poioapi.io.graf.tier_prefixes(
+                prefix + GRAFSEPARATOR):
+            self._tier_codes_for_name.setdefault(tier_name, []).append(
+                tier_code)
+
+        return tier_code
+
+    def _value_code(self, value):
+        if value is None:
+            return -1
+
+        try:
+            return self._value_codes[value]
+        except KeyError:
+            value_code = len(self.values)
+            self.values.append(value)
+            self._value_codes[value] = value_code
+            return value_code
+
+    def _add_node(self, tier_code, annotation, region, parent_node):
+        node = len(self.node_tier)
+
+        self.node_tier.append(tier_code)
+        self.node_parent.append(parent_node)
+        self.node_first_child.append(-1)
+        self.node_last_child.append(-1)
+        self.node_next_sibling.append(-1)
+        self.node_value.append(self._value_code(annotation.value))
+        self.annotation_ids.append(annotation.id)
+
+        if annotation.features:
+            self.node_features[node] = annotation.features
+        if region is not None:
+            self.node_regions[node] = region
+
+        if parent_node != -1:
+            last_child = self.node_last_child[parent_node]
+            if last_child == -1:
+                self.node_first_child[parent_node] = node
             else:
-                if t == parent_tier:
-                    tiers_list.append([tier])
+                self.node_next_sibling[last_child] = node
+            self.node_last_child[parent_node] = node
+
+        # a node ID appears only once in a tier, like in a GrAF graph the
+        # last node with the same ID replaces the previous one
+        tier_nodes = self.nodes_by_tier[tier_code]
+        position = self._tier_positions.setdefault(
+            (tier_code, annotation.id), len(tier_nodes))
+        if position == len(tier_nodes):
+            tier_nodes.append(node)
+        else:
+            tier_nodes[position] = node
+
+        return node
+
+    def tier_codes(self, tier_name):
+        """Return the codes of all tiers that belong to the given tier name.
+        As with GrAF node IDs the tier name may be an annotation space or a
+        full tier prefix.
+
+        Parameters
+        ----------
+        tier_name : str
+            The name of the tier.
 
-    # def _add_node(self, node_id, annotation, annotation_name, regions,
-    #         from_node_id):
-    #     self._add_node_to_graph(node_id, regions, from_node_id)
-    #     self._add_graf_annotation(annotation_name, annotation.id, node_id,
-    #                               annotation.value, annotation.features)
+        Returns
+        -------
+        tier_codes : list of int
 
-    # def _add_root_nodes(self, prefix, node_id):
-    #     if prefix in self.root_tiers:
-    #         self.graf.header.roots.append(node_id.to_str())
+        """
+        return self._tier_codes_for_name.get(tier_name, [])
+
+    def children(self, node):
+        """Iterate over the children of a node in the order they were added.
+
+        Parameters
+        ----------
+        node : int
+            The node.
+
+        """
+        child = self.node_first_child[node]
+        while child != -1:
+            yield child
+            child = self.node_next_sibling[child]
+
+    def node_ids_for_tier(self, tier_name, parent_node=-1):
+        """Return the integer IDs of the nodes of a tier. If a parent node
+        is given only its children are returned.
+
+        Parameters
+        ----------
+        tier_name : str
+            The name of the tier.
+        parent_node : int
+            The parent node, -1 for all nodes of the tier.
+
+        Returns
+        -------
+        nodes : list of int
+
+        """
+        tier_codes = self.tier_codes(tier_name)
+
+        if parent_node != -1:
+            return [n for n in self.children(parent_node)
+                    if self.node_tier[n] in tier_codes]
 
-    # def _add_graf_annotation(self, annotation_name, annotation_id,
-    #         annotation_ref, annotation_value, annotation_features=None):
-    #     annotation = graf.Annotation(annotation_name, annotation_features,
-    #                                  annotation_id)
+        if len(tier_codes) == 1:
+            return list(self.nodes_by_tier[tier_codes[0]])
 
-    #     if annotation_value is not None:
-    #         annotation.features['annotation_value'] = annotation_value
+        return list(heapq.merge(*[self.nodes_by_tier[c] for c in tier_codes]))
 
-    #     self.graf.nodes[annotation_ref.to_str()].annotations.add(annotation)
+    def nodes_for_tier(self, tier_name, parent_node=None):
+        """Return the nodes of a tier as MemoryNode objects. If a parent node
+        is given only its children are returned.
 
-    #     if annotation_name in self.graf.annotation_spaces:
-    #         #if annotation not in self.graf.annotation_spaces[annotation_name]:
-    #         self.graf.annotation_spaces[annotation_name].add(annotation)
-    #     else:
-    #         annotation_space = graf.AnnotationSpace(annotation_name)
-    #         annotation_space.add(annotation)
+        Parameters
+        ----------
+        tier_name : str
+            The name of the tier.
+        parent_node : MemoryNode
+            The parent node.
 
-    #         self.graf.annotation_spaces.add(annotation_space)
+        Returns
+        -------
+        nodes : list of MemoryNode
 
-    # def _add_node_to_graph(self, node_id, regions=None,
-    #                        from_node_id=None):
+        """
+        parent = -1
+        if parent_node is not None:
+            parent = parent_node.index
+
+        return [MemoryNode(self, n)
+                for n in self.node_ids_for_tier(tier_name, parent)]
+
+    def node_id(self, node):
+        """Return the GrAF ID of a node, e.g. "utterance..W-Spch..na1".
+
+        """
+        return "{0}{1}n{2}".format(self.tiers[self.node_tier[node]],
+            GRAFSEPARATOR, self.annotation_ids[node])
+
+    def value(self, node):
+        """Return the annotation value of a node.
 
-    #     node = graf.Node(node_id.to_str())
+        """
+        value_code = self.node_value[node]
+        if value_code == -1:
+            return None
+        return self.values[value_code]
 
-    #     if from_node_id is not None:
-    #         edge_id = node_id.str_edge()
-    #         self.graf.create_edge(self.graf.nodes[from_node_id.to_str()], node,
-    #             edge_id)
 
-    #     if regions is not None:
-    #         region_id = node_id.str_region()
-    #         region = graf.Region(region_id, *regions)
-    #         node.add_region(region)
+class MemoryNode(object):
+    """A view on a node in a MemoryConverter. It provides the same
+    attributes as a graf.Node, the annotations and regions are created when
+    they are accessed.
 
-    #         self.graf.regions.add(region)
+    """
 
-    #     self.graf.nodes.add(node)
+    __slots__ = ['store', 'index']
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    def __repr__(self):
+        return "NodeID = " + self.id
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.store is other.store and \
+            self.index == other.index
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(self.index)
+
+    def __lt__(self, other):
+        return self.id < other.id
+
+    @property
+    def id(self):
+        return self.store.node_id(self.index)
+
+    @property
+    def annotations(self):
+        store = self.store
+        annotation = graf.Annotation(
+            store.annotation_spaces[store.node_tier[self.index]],
+            store.node_features.get(self.index),
+            store.annotation_ids[self.index])
+
+        value = store.value(self.index)
+        if value is not None:
+            annotation.features['annotation_value'] = value
+
+        annotations = graf.annotations.AnnotationList(self, 'element')
+        annotations.add(annotation)
+        return annotations
+
+    @property
+    def links(self):
+        region = self.store.node_regions.get(self.index)
+        if region is None:
+            return []
+
+        region_id = "{0}{1}r{2}".format(
+            self.store.tiers[self.store.node_tier[self.index]],
+            GRAFSEPARATOR, self.store.annotation_ids[self.index])
+        return [graf.Link([graf.Region(region_id, *region)])]
+
+    def iter_children(self):
+        for child in self.store.children(self.index):
+            yield MemoryNode(self.store, child)
+
+    def iter_parents(self):
+        parent = self.store.node_parent[self.index]
+        if parent != -1:
+            yield MemoryNode(self.store, parent)
+
+    @property
+    def parent(self):
+        parent = self.store.node_parent[self.index]
+        if parent == -1:
+            raise AttributeError('%r has no parents' % self)
+        return MemoryNode(self.store, parent)
@@ -0,0 +1,562 @@
+# -*- coding: utf-8 -*-
+#
+# Poio Tools for Linguists
+#
+# Copyright (C) 2009-2014 Poio Project
+# Author: Peter Bouda <pbouda@cidles.eu>
+# URL: <http://media.cidles.eu/poio/>
+# For license information, see LICENSE.TXT
+
+"""This module contains classes to store an annotation graph in a compact
+binary snapshot and to load it again. A snapshot contains the nodes, edges,
+regions, annotations, the tier hierarchies, the meta information and the
+primary data of an AnnotationGraph.
+
+The file starts with a header and a table of sections. Each section is an
+array of 64-bit integers or a block of UTF-8 text, aligned to 8 bytes. All
+strings are stored once in a string table and referenced by their index. The
+reader maps the file into memory with `mmap` and accesses the arrays without
+copying them, there is no text parsing involved when a snapshot is loaded.
+
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import sys
+import struct
+import mmap
+import json
+
+from xml.etree.ElementTree import fromstring, tostring
+
+import graf
+
+import poioapi.io.graf
+
+MAGIC = b"POIOSNAP"
+VERSION = 1
+
+_HEADER = struct.Struct(str("<8sIBxxxI"))
+_SECTION = struct.Struct(str("<8sQQ"))
+
+# kinds of values
+(_NONE, _STR, _INT, _FLOAT, _BOOL) = range(5)
+
+
+class SnapshotError(Exception): pass
+
+
+def _array_bytes(a):
+    if isinstance(a, list):
+        # no array type with 8 byte items, see poioapi.io.graf.int64_array
+        return struct.pack(str("={0}q").format(len(a)), *a)
+    if hasattr(a, 'tobytes'):
+        return a.tobytes()
+    return a.tostring()
+
+
+class Writer(poioapi.io.graf.BaseWriter):
+    """This class writes an AnnotationGraph as a binary snapshot.
+
+    """
+
+    def write(self, outputfile, ag):
+        """Write an AnnotationGraph object as binary snapshot.
+
+        Parameters
+        ----------
+        outputfile : str
+            The filename of the output file.
+        ag : poioapi.annotationgraph.AnnotationGraph
+            An AnnotationGraph object. The AG object containes the data that
+            will be use for output.
+
+        """
+        if hasattr(ag, 'load_all_tiers'):
+            ag.load_all_tiers()
+
+        self._strings = []
+        self._string_index = {}
+
+        graph = ag.graf
+        sections = []
+
+        nodes, edges, regions = self._elements(graph)
+
+        region_index = dict((id(region), i)
+                            for i, region in enumerate(regions))
+        region_ids = poioapi.io.graf.int64_array()
+        anchor_offsets = poioapi.io.graf.int64_array([0])
+        anchor_kinds = poioapi.io.graf.int64_array()
+        anchor_refs = poioapi.io.graf.int64_array()
+        for region in regions:
+            region_ids.append(self._string(region.id))
+            for anchor in region.anchors:
+                kind, ref = self._value(anchor)
+                anchor_kinds.append(kind)
+                anchor_refs.append(ref)
+            anchor_offsets.append(len(anchor_kinds))
+
+        edge_index = dict((id(edge), i) for i, edge in enumerate(edges))
+        node_index = dict((id(node), i) for i, node in enumerate(nodes))
+        node_ids = poioapi.io.graf.int64_array()
+        link_offsets = poioapi.io.graf.int64_array([0])
+        link_region_offsets = poioapi.io.graf.int64_array([0])
+        link_regions = poioapi.io.graf.int64_array()
+        out_edge_offsets = poioapi.io.graf.int64_array([0])
+        out_edges = poioapi.io.graf.int64_array()
+        in_edge_offsets = poioapi.io.graf.int64_array([0])
+        in_edges = poioapi.io.graf.int64_array()
+        for node in nodes:
+            node_ids.append(self._string(node.id))
+            for link in node.links:
+                for region in link:
+                    link_regions.append(region_index[id(region)])
+                link_region_offsets.append(len(link_regions))
+            link_offsets.append(len(link_region_offsets) - 1)
+            out_edges.extend(edge_index[id(e)] for e in node.out_edges)
+            out_edge_offsets.append(len(out_edges))
+            in_edges.extend(edge_index[id(e)] for e in node.in_edges)
+            in_edge_offsets.append(len(in_edges))
+
+        edge_ids = poioapi.io.graf.int64_array()
+        edge_from = poioapi.io.graf.int64_array()
+        edge_to = poioapi.io.graf.int64_array()
+        edge_pos_kinds = poioapi.io.graf.int64_array()
+        edge_pos_refs = poioapi.io.graf.int64_array()
+        for edge in edges:
+            edge_ids.append(self._string(edge.id))
+            edge_from.append(node_index[id(edge.from_node)])
+            edge_to.append(node_index[id(edge.to_node)])
+            kind, ref = self._value(edge.pos)
+            edge_pos_kinds.append(kind)
+            edge_pos_refs.append(ref)
+
+        counts = poioapi.io.graf.int64_array([len(graph.nodes),
+            len(graph.edges), len(graph.regions),
+            poioapi.io.graf.next_edge_position(graph)])
+
+        # annotations of nodes and edges
+        annotation_owners = poioapi.io.graf.int64_array()
+        annotation_labels = poioapi.io.graf.int64_array()
+        annotation_id_kinds = poioapi.io.graf.int64_array()
+        annotation_id_refs = poioapi.io.graf.int64_array()
+        annotation_spaces = poioapi.io.graf.int64_array()
+        feature_offsets = poioapi.io.graf.int64_array([0])
+        feature_keys = poioapi.io.graf.int64_array()
+        feature_kinds = poioapi.io.graf.int64_array()
+        feature_refs = poioapi.io.graf.int64_array()
+        elements = [(i, node) for i, node in enumerate(nodes)] + \
+            [(-1 - i, edge) for i, edge in enumerate(edges)]
+        for owner, element in elements:
+            for annotation in element.annotations:
+                annotation_owners.append(owner)
+                annotation_labels.append(self._string(annotation.label))
+                kind, ref = self._value(annotation.id)
+                annotation_id_kinds.append(kind)
+                annotation_id_refs.append(ref)
+                if annotation.aspace is not None:
+                    annotation_spaces.append(
+                        self._string(annotation.aspace.as_id))
+                else:
+                    annotation_spaces.append(-1)
+                for key, value in self._flatten_features(annotation.features):
+                    feature_keys.append(self._string(key))
+                    kind, ref = self._value(value)
+                    feature_kinds.append(kind)
+                    feature_refs.append(ref)
+                feature_offsets.append(len(feature_keys))
+
+        roots = poioapi.io.graf.int64_array(
+            [self._string(r) for r in graph.header.roots])
+        depends_on = poioapi.io.graf.int64_array(
+            [self._string(d) for d in graph.header.depends_on])
+        space_ids = poioapi.io.graf.int64_array(
+            [self._string(s) for s in graph.annotation_spaces.keys()])
+
+        sections.extend([
+            (b"COUNTS", counts), (b"NODES", node_ids),
+            (b"LINKS", link_offsets),
+            (b"LINKREGS", link_region_offsets), (b"LREGIONS", link_regions),
+            (b"REGIONS", region_ids), (b"ANCHOFFS", anchor_offsets),
+            (b"ANCHKIND", anchor_kinds), (b"ANCHREFS", anchor_refs),
+            (b"EDGES", edge_ids), (b"EDGEFROM", edge_from),
+            (b"EDGETO", edge_to), (b"EDGPOSKN", edge_pos_kinds),
+            (b"EDGPOSRF", edge_pos_refs),
+            (b"OUTOFFS", out_edge_offsets), (b"OUTEDGES", out_edges),
+            (b"INOFFS", in_edge_offsets), (b"INEDGES", in_edges),
+            (b"ANNOWNER", annotation_owners),
+            (b"ANNLABEL", annotation_labels),
+            (b"ANNIDKND", annotation_id_kinds),
+            (b"ANNIDREF", annotation_id_refs),
+            (b"ANNSPACE", annotation_spaces),
+            (b"FEATOFFS", feature_offsets), (b"FEATKEYS", feature_keys),
+            (b"FEATKIND", feature_kinds), (b"FEATREFS", feature_refs),
+            (b"ROOTS", roots), (b"DEPENDS", depends_on),
+            (b"SPACES", space_ids)
+        ])
+
+        # the meta data and the primary data are stored as text
+        primary_data = ag.primary_data
+        content = None
+        meta = {
+            'tier_hierarchies': ag.tier_hierarchies,
+            'root_tiers': ag.root_tiers,
+            'source_type': ag.source_type,
+            'meta_information': self._meta_information(ag.meta_information),
+            'primary_data': None
+        }
+        if primary_data is not None:
+            meta['primary_data'] = {
+                'type': primary_data.type,
+                'external_link': primary_data.external_link,
+                'filename': primary_data.filename
+            }
+            content = primary_data.content
+
+        sections.append((b"META", json.dumps(meta).encode('utf-8')))
+        if content is not None:
+            sections.append((b"PRIMARY", content.encode('utf-8')))
+
+        # the string table is written last, all strings are known now. The
+        # offsets count characters, the reader decodes the table at once.
+        string_offsets = poioapi.io.graf.int64_array([0])
+        length = 0
+        for string in self._strings:
+            length += len(string)
+            string_offsets.append(length)
+        sections.append((b"STROFFS", string_offsets))
+        sections.append((b"STRDATA", "".join(self._strings).encode('utf-8')))
+
+        self._write_sections(outputfile, sections)
+
+    def _elements(self, graph):
+        """Return all nodes, edges and regions of the graph. A parser may
+        create several elements with the same ID. Only the last one is
+        stored in the dicts of the graph, but the others are still connected
+        to the graph. They are added after the elements of the dicts.
+
+        """
+        nodes = list(graph.nodes)
+        edges = list(graph.edges)
+        regions = list(graph.regions)
+        seen = set(id(e) for e in nodes + edges + regions)
+
+        def add(element, elements):
+            if id(element) not in seen:
+                seen.add(id(element))
+                elements.append(element)
+
+        n = e = 0
+        while n < len(nodes) or e < len(edges):
+            while n < len(nodes):
+                node = nodes[n]
+                for edge in node.out_edges:
+                    add(edge, edges)
+                for edge in node.in_edges:
+                    add(edge, edges)
+                for link in node.links:
+                    for region in link:
+                        add(region, regions)
+                n += 1
+            while e < len(edges):
+                add(edges[e].from_node, nodes)
+                add(edges[e].to_node, nodes)
+                e += 1
+
+        return nodes, edges, regions
+
+    def _write_sections(self, outputfile, sections):
+        blocks = []
+        for name, data in sections:
+            if not isinstance(data, bytes):
+                data = _array_bytes(data)
+            blocks.append((name, data))
+
+        offset = _HEADER.size + _SECTION.size * len(blocks)
+        table = []
+        for name, data in blocks:
+            offset += -offset % 8
+            table.append(_SECTION.pack(name, offset, len(data)))
+            offset += len(data)
+
+        byteorder = 0 if sys.byteorder == 'little' else 1
+        out = open(outputfile, "wb")
+        out.write(_HEADER.pack(MAGIC, VERSION, byteorder, len(blocks)))
+        out.write(b"".join(table))
+        position = _HEADER.size + _SECTION.size * len(blocks)
+        for name, data in blocks:
+            padding = -position % 8
+            out.write(b"\0" * padding)
+            out.write(data)
+            position += padding + len(data)
+        out.close()
+
+    def _string(self, s):
+        try:
+            return self._string_index[s]
+        except KeyError:
+            index = len(self._strings)
+            self._strings.append(s)
+            self._string_index[s] = index
+            return index
+
+    def _value(self, value):
+        if value is None:
+            return _NONE, 0
+        elif isinstance(value, bool):
+            return _BOOL, int(value)
+        elif isinstance(value, int):
+            return _INT, value
+        elif isinstance(value, float):
+            return _FLOAT, self._string(repr(value))
+        return _STR, self._string(value)
+
+    def _flatten_features(self, features, path=""):
+        for key, value in features.items():
+            if isinstance(value, graf.FeatureStructure):
+                for item in self._flatten_features(value,
+                        "{0}{1}/".format(path, key)):
+                    yield item
+            else:
+                yield path + key, value
+
+    def _meta_information(self, meta_information):
+        if meta_information is None:
+            return None
+        if hasattr(meta_information, 'tag'):
+            return {'xml': tostring(meta_information,
+                encoding="utf-8").decode('utf-8')}
+        return {'json': meta_information}
+
+
+class Reader:
+    """This class loads a binary snapshot. The file is mapped into memory
+    and the graph is built directly from the arrays in the file. After
+    `read` the attributes `graf`, `tier_hierarchies`, `meta_information`,
+    `root_tiers`, `primary_data` and `source_type` are set, like the
+    attributes of a GrAFConverter.
+
+    """
+
+    def __init__(self, inputfile):
+        self.inputfile = inputfile
+        self.graf = None
+        self.tier_hierarchies = []
+        self.meta_information = None
+        self.root_tiers = []
+        self.primary_data = None
+        self.source_type = None
+
+    def read(self):
+        """Load the snapshot file.
+
+        Raises
+        ------
+        SnapshotError
+            If the file is not a snapshot or has an unknown version.
+
+        """
+        with open(self.inputfile, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._views = []
+
+        try:
+            self._read_sections()
+            self._read_graph()
+            self._read_meta()
+        finally:
+            for view in self._views:
+                view.release()
+            self._views = []
+            self._sections = None
+            self._strings = None
+            self._map.close()
+
+    def _read_sections(self):
+        magic, version, byteorder, count = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise SnapshotError("{0} is not a snapshot file".format(
+                self.inputfile))
+        if version != VERSION:
+            raise SnapshotError("Snapshot version {0} is not supported".format(
+                version))
+        self._swap = byteorder != (0 if sys.byteorder == 'little' else 1)
+
+        self._sections = {}
+        for i in range(count):
+            name, offset, length = _SECTION.unpack_from(self._map,
+                _HEADER.size + i * _SECTION.size)
+            self._sections[name.rstrip(b"\0")] = (offset, length)
+
+        offsets = self._array(b"STROFFS")
+        data = self._bytes(b"STRDATA").decode('utf-8')
+        self._strings = [data[offsets[i]:offsets[i + 1]]
+                         for i in range(len(offsets) - 1)]
+
+    def _bytes(self, name):
+        offset, length = self._sections[name]
+        return self._map[offset:offset + length]
+
+    def _array(self, name):
+        offset, length = self._sections[name]
+        if sys.version_info[:2] >= (3, 3) and not self._swap and \
+                poioapi.io.graf.INT64_TYPECODE == 'q':
+            # a view on the mapped file, nothing is copied
+            view = memoryview(self._map)
+            self._views.append(view)
+            view = view[offset:offset + length].cast('q')
+            self._views.append(view)
+            return view
+
+        a = poioapi.io.graf.int64_array()
+        data = self._map[offset:offset + length]
+        if isinstance(a, list):
+            byteorder = '='
+            if self._swap:
+                byteorder = '>' if sys.byteorder == 'little' else '<'
+            return list(struct.unpack(str("{0}{1}q").format(byteorder,
+                length // 8), data))
+        if hasattr(a, 'frombytes'):
+            a.frombytes(data)
+        else:
+            a.fromstring(data)
+        if self._swap:
+            a.byteswap()
+        return a
+
+    def _string(self, index):
+        return self._strings[index]
+
+    def _value(self, kind, ref):
+        if kind == _NONE:
+            return None
+        elif kind == _BOOL:
+            return bool(ref)
+        elif kind == _INT:
+            return ref
+        elif kind == _FLOAT:
+            return float(self._string(ref))
+        return self._string(ref)
+
+    def _read_graph(self):
+        graph = graf.Graph()
+
+        # the first elements are in the dicts of the graph, the others are
+        # only connected to it
+        (graph_nodes, graph_edges, graph_regions, edge_pos) = \
+            self._array(b"COUNTS")
+
+        region_ids = self._array(b"REGIONS")
+        anchor_offsets = self._array(b"ANCHOFFS")
+        anchor_kinds = self._array(b"ANCHKIND")
+        anchor_refs = self._array(b"ANCHREFS")
+        regions = []
+        for i in range(len(region_ids)):
+            anchors = [self._value(anchor_kinds[a], anchor_refs[a])
+                       for a in range(anchor_offsets[i], anchor_offsets[i + 1])]
+            region = graf.Region(self._string(region_ids[i]), *anchors)
+            if i < graph_regions:
+                graph.regions.add(region)
+            regions.append(region)
+
+        node_ids = self._array(b"NODES")
+        link_offsets = self._array(b"LINKS")
+        link_region_offsets = self._array(b"LINKREGS")
+        link_regions = self._array(b"LREGIONS")
+        nodes = []
+        for i in range(len(node_ids)):
+            node = graf.Node(self._string(node_ids[i]))
+            for l in range(link_offsets[i], link_offsets[i + 1]):
+                node.add_link(graf.Link(
+                    [regions[r] for r in link_regions[
+                        link_region_offsets[l]:link_region_offsets[l + 1]]]))
+            if i < graph_nodes:
+                graph.nodes.add(node)
+            nodes.append(node)
+
+        edge_ids = self._array(b"EDGES")
+        edge_from = self._array(b"EDGEFROM")
+        edge_to = self._array(b"EDGETO")
+        edge_pos_kinds = self._array(b"EDGPOSKN")
+        edge_pos_refs = self._array(b"EDGPOSRF")
+        edges = []
+        for i in range(len(edge_ids)):
+            edge = graf.Edge(self._string(edge_ids[i]), nodes[edge_from[i]],
+                nodes[edge_to[i]],
+                self._value(edge_pos_kinds[i], edge_pos_refs[i]))
+            edges.append(edge)
+        # the edges of the nodes are added below in their original order
+        poioapi.io.graf.restore_edges(graph, edges[:graph_edges], edge_pos)
+
+        out_edge_offsets = self._array(b"OUTOFFS")
+        out_edges = self._array(b"OUTEDGES")
+        in_edge_offsets = self._array(b"INOFFS")
+        in_edges = self._array(b"INEDGES")
+        for i, node in enumerate(nodes):
+            for e in out_edges[out_edge_offsets[i]:out_edge_offsets[i + 1]]:
+                node.out_edges.add(edges[e])
+            for e in in_edges[in_edge_offsets[i]:in_edge_offsets[i + 1]]:
+                node.in_edges.add(edges[e])
+
+        for i in self._array(b"SPACES"):
+            graph.annotation_spaces.create(self._string(i))
+
+        annotation_owners = self._array(b"ANNOWNER")
+        annotation_labels = self._array(b"ANNLABEL")
+        annotation_id_kinds = self._array(b"ANNIDKND")
+        annotation_id_refs = self._array(b"ANNIDREF")
+        annotation_spaces = self._array(b"ANNSPACE")
+        feature_offsets = self._array(b"FEATOFFS")
+        feature_keys = self._array(b"FEATKEYS")
+        feature_kinds = self._array(b"FEATKIND")
+        feature_refs = self._array(b"FEATREFS")
+        for i in range(len(annotation_owners)):
+            annotation = graf.Annotation(self._string(annotation_labels[i]),
+                None, self._value(annotation_id_kinds[i],
+                                  annotation_id_refs[i]))
+            for f in range(feature_offsets[i], feature_offsets[i + 1]):
+                annotation.features[self._string(feature_keys[f])] = \
+                    self._value(feature_kinds[f], feature_refs[f])
+
+            owner = annotation_owners[i]
+            if owner >= 0:
+                nodes[owner].annotations.add(annotation)
+            else:
+                edges[-1 - owner].annotations.add(annotation)
+
+            if annotation_spaces[i] != -1:
+                graph.annotation_spaces[self._string(
+                    annotation_spaces[i])].add(annotation)
+
+        for i in self._array(b"ROOTS"):
+            graph.header.roots.append(self._string(i))
+        for i in self._array(b"DEPENDS"):
+            graph.header.add_dependency(self._string(i))
+
+        self.graf = graph
+
+    def _read_meta(self):
+        meta = json.loads(self._bytes(b"META").decode('utf-8'))
+
+        self.tier_hierarchies = meta['tier_hierarchies']
+        self.root_tiers = meta['root_tiers']
+        self.source_type = meta['source_type']
+
+        meta_information = meta['meta_information']
+        if meta_information is None:
+            self.meta_information = None
+        elif 'xml' in meta_information:
+            self.meta_information = fromstring(
+                meta_information['xml'].encode('utf-8'))
+        else:
+            self.meta_information = meta_information['json']
+
+        if meta['primary_data'] is not None:
+            primary_data = poioapi.io.graf.PrimaryData()
+            primary_data.type = meta['primary_data']['type']
+            primary_data.external_link = meta['primary_data']['external_link']
+            primary_data.filename = meta['primary_data']['filename']
+            if b"PRIMARY" in self._sections:
+                primary_data.content = self._bytes(b"PRIMARY").decode('utf-8')
+            self.primary_data = primary_data
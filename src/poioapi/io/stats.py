@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+#
+# Poio Tools for Linguists
+#
+# Copyright (C) 2009-2014 Poio Project
+# Author: Peter Bouda <pbouda@cidles.eu>
+# URL: <http://media.cidles.eu/poio/>
+# For license information, see LICENSE.TXT
+
+"""
+This module contains a class to collect statistics about a conversion: the
+wall time of each phase, like reading the input file, converting the tiers
+or writing the output, the number of nodes, edges and regions that were
+created for each tier and the peak number of objects in the graph.
+
+The statistics are only collected when a ConversionStats object is passed to
+the converter or to AnnotationGraph, e.g.:
+
+>>> stats = poioapi.io.stats.ConversionStats()
+>>> ag = poioapi.annotationgraph.AnnotationGraph.from_elan(
+...     "example.eaf", stats=stats)
+>>> stats.to_json()
+
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import collections
+import contextlib
+import json
+import time
+
+
+class ConversionStats(object):
+    """Collects the timing of the phases of a conversion and the number of
+    created objects.
+
+    Parameters
+    ----------
+    callback : callable
+        An optional function that is called with the name of a phase and
+        its wall time in seconds each time a phase ends.
+
+    """
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.phases = collections.OrderedDict()
+        self.calls = collections.OrderedDict()
+        self.tiers = collections.OrderedDict()
+        self.peaks = collections.OrderedDict()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Measure the wall time of a phase. The time of a phase that runs
+        several times is added up.
+
+        Parameters
+        ----------
+        name : str
+            The name of the phase, e.g. "convert".
+
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            seconds = time.time() - start
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+            self.calls[name] = self.calls.get(name, 0) + 1
+            if self.callback is not None:
+                self.callback(name, seconds)
+
+    def count(self, tier, nodes=0, edges=0, regions=0):
+        """Add to the number of objects that were created for a tier.
+
+        Parameters
+        ----------
+        tier : str
+            The tier, e.g. "words..W-Words".
+        nodes, edges, regions : int
+            The number of created objects.
+
+        """
+        counts = self.tiers.get(tier)
+        if counts is None:
+            counts = self.tiers[tier] = {'nodes': 0, 'edges': 0, 'regions': 0}
+        counts['nodes'] += nodes
+        counts['edges'] += edges
+        counts['regions'] += regions
+
+    def peak(self, name, value):
+        """Record a value if it is greater than the previous peak value with
+        the same name.
+
+        Parameters
+        ----------
+        name : str
+            The name of the value, e.g. "nodes".
+        value : int
+            The current value.
+
+        """
+        if value > self.peaks.get(name, 0):
+            self.peaks[name] = value
+
+    def totals(self):
+        """Return the number of created objects for all tiers.
+
+        Returns
+        -------
+        totals : dict
+            The number of nodes, edges and regions.
+
+        """
+        totals = {'nodes': 0, 'edges': 0, 'regions': 0}
+        for counts in self.tiers.values():
+            for key in totals:
+                totals[key] += counts[key]
+        return totals
+
+    def as_dict(self):
+        """Return the statistics as a dict that only contains dicts, strings
+        and numbers.
+
+        Returns
+        -------
+        stats : dict
+
+        """
+        return collections.OrderedDict([
+            ('phases', collections.OrderedDict(
+                (name, {'seconds': seconds, 'calls': self.calls[name]})
+                for name, seconds in self.phases.items())),
+            ('tiers', collections.OrderedDict(
+                (tier, dict(counts)) for tier, counts in self.tiers.items())),
+            ('totals', self.totals()),
+            ('peaks', dict(self.peaks))])
+
+    def to_json(self, outputfile=None):
+        """Export the statistics as JSON.
+
+        Parameters
+        ----------
+        outputfile : str
+            If given, the JSON is written to this file.
+
+        Returns
+        -------
+        json : str
+            The statistics as a JSON string.
+
+        """
+        result = json.dumps(self.as_dict(), indent=2)
+        if outputfile is not None:
+            with open(outputfile, 'w') as f:
+                f.write(result)
+        return result
+
+
+@contextlib.contextmanager
+def _no_phase():
+    yield
+
+
+def phase(stats, name):
+    """Return a context manager that measures a phase if `stats` is not None.
+
+    Parameters
+    ----------
+    stats : ConversionStats or None
+        The statistics object.
+    name : str
+        The name of the phase.
+
+    """
+    if stats is None:
+        return _no_phase()
+    return stats.phase(name)
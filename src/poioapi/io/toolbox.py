@@ -76,7 +76,7 @@ class Parser(poioapi.io.graf.BaseParser):
         #morpheme_level_markers = tier_map[poioapi.data.TIER_MORPHEME],
         #tag_level_markers = tier_map[poioapi.data.TIER_GLOSS] + \
         #    tier_map[poioapi.data.TIER_POS],
-        mapper=None):
+        mapper=None, streaming=False):
         """Class's constructor.
 
         Parameters
@@ -86,6 +86,10 @@ class Parser(poioapi.io.graf.BaseParser):
         record_marker : str
             The marker that marks the start of a Toolbox record in the input
             file.
+        streaming : bool
+            If True, the annotations are not read by the constructor but
+            record by record with iter_records(). Only the annotations of
+            the current record are kept in memory.
 
         """
 
@@ -94,6 +98,7 @@ class Parser(poioapi.io.graf.BaseParser):
 
         self.input_stream = input_stream
         self.record_marker = record_marker
+        self.streaming = streaming
 
         if mapper is None:
             self._tier_labels = tier_mapping()
@@ -163,7 +168,26 @@ class Parser(poioapi.io.graf.BaseParser):
             self.tier_hierarchy = poioapi.data.DataStructureType(
                 new_tier_hierarchy)
         
-        self._build_annotations()
+        if not self.streaming:
+            self._build_annotations()
+
+    def iter_records(self):
+        """Read the input file record by record. The annotations of a
+        record are complete when the marker of the next record is found.
+        Before the next record is read, the annotations of the previous
+        record are removed, so that only the current record is kept in
+        memory. The records have to be separated by empty lines.
+
+        Returns
+        -------
+        records : generator of tuple
+            The root tier and the annotation of each record.
+
+        """
+
+        tier = poioapi.io.graf.Tier(self.record_marker)
+        for annotation in self._read_records(True):
+            yield (tier, annotation)
 
     def _get_tiers(self):
         # Go through lines in the input file
@@ -184,7 +208,22 @@ class Parser(poioapi.io.graf.BaseParser):
         in attributes.
 
         """
- 
+
+        for _ in self._read_records():
+            pass
+
+    def _read_records(self, streaming=False):
+        """Parse the input file and yield the annotation of each record as
+        soon as the record is complete.
+
+        Parameters
+        ----------
+        streaming : bool
+            If True, the annotations of a record are removed before the
+            next record is read.
+
+        """
+
         elements = dict()
         ids = dict()
 
@@ -196,6 +235,7 @@ class Parser(poioapi.io.graf.BaseParser):
         tier_marker = None
 
         current_utterance = None
+        record = None
 
         # Go through lines in the input file
         for line_number, line in enumerate(self.input_stream):
@@ -316,10 +356,16 @@ class Parser(poioapi.io.graf.BaseParser):
                                                  current_utterance_id,
                                                  current_utterance)
 
+                    if record is not None:
+                        yield record
+                        if streaming:
+                            self._annotations_for_parent = \
+                                collections.defaultdict(list)
+
+                    record = poioapi.io.graf.Annotation(
+                        "a{0}".format(current_id), line_content)
                     self._annotations_for_parent[
-                        (None, tier_marker)].append(
-                            poioapi.io.graf.Annotation(
-                                "a{0}".format(current_id), line_content))
+                        (None, tier_marker)].append(record)
                     current_record_id = current_id
                     current_id += 1
                     current_utterance = None
@@ -340,6 +386,9 @@ class Parser(poioapi.io.graf.BaseParser):
 
                     current_id += 1
 
+        if record is not None:
+            yield record
+
         self.input_stream.seek(0)
         
     def _process_record(self, elements, ids, utterance_id):
@@ -10,6 +10,7 @@
 from __future__ import absolute_import, unicode_literals
 
 import os
+import codecs
 
 import xml.etree.ElementTree as ET
 
@@ -17,49 +18,106 @@ import poioapi.io.graf
 
 
 class Parser(poioapi.io.graf.BaseParser):
+    """Parser for the XML output of the Wikipedia extractor. Each document is
+    an annotation of the tier "doc" with a region in the primary text.
 
-    def __init__(self, filepath):
+    Parameters
+    ----------
+    filepath : str
+        The path to the XML file.
+    primary_data_file : str
+        If given, the primary text is written to this file instead of being
+        kept in memory. The file is written once, when the documents are
+        read. The primary data is then memory-mapped from the file.
+
+    """
+
+    def __init__(self, filepath, primary_data_file=None):
         self.filepath = filepath
+        self.primary_data_file = primary_data_file
         (self.basedirname, _) = os.path.splitext(os.path.abspath(self.filepath))
 
         self.parse()
 
     def parse(self):
-        self.root = ET.parse(self.filepath).getroot()
         self.documents_map = {}
         self.documents = []
+        self._annotations = None
+        self._content_file = None
 
-    def get_root_tiers(self):
-        return [poioapi.io.graf.Tier('doc')]
+    def _read_documents(self):
+        """Read the annotations and the text of all documents. The XML file
+        is read incrementally and each document element is cleared after it
+        was read. If there is a primary data file, the text is written to
+        the file and not kept in memory.
 
-    def get_child_tiers_for_tier(self, tier):
-        pass
+        """
 
-    def get_annotations_for_tier(self, tier, annotation_parent=None):
-        annotations = []
+        self._annotations = []
         last_position = 0
 
-        if tier.name == "doc":
-            for a, annotation in enumerate(self.root):
-                text = annotation.text
-                id = annotation.attrib["id"]
+        f = None
+        if self.primary_data_file is not None:
+            f = codecs.open(self.primary_data_file, 'w', 'utf-8')
+
+        depth = 0
+        root = None
+        for event, annotation in ET.iterparse(self.filepath,
+                                              events=("start", "end")):
+            if event == "start":
+                if root is None:
+                    root = annotation
+                depth += 1
+                continue
 
-                features = {"title":annotation.attrib["title"],
-                            "url":annotation.attrib["url"]}
+            depth -= 1
+            if depth != 1:
+                continue
 
-                annotations.append(poioapi.io.graf.Annotation(id,
-                    None, features))
+            text = annotation.text
+            id = annotation.attrib["id"]
 
-                if len(annotation) is not 0:
-                    text += annotation[0].tail
+            features = {"title":annotation.attrib["title"],
+                        "url":annotation.attrib["url"]}
 
-                self.documents_map[id] = (last_position, last_position +
-                                                         len(text) + 1)
+            self._annotations.append(poioapi.io.graf.Annotation(id,
+                None, features))
+
+            if len(annotation) != 0:
+                text += annotation[0].tail
+
+            self.documents_map[id] = (last_position, last_position +
+                                                     len(text) + 1)
+            if f is None:
                 self.documents.append(text)
+            else:
+                if last_position > 0:
+                    f.write("\n")
+                f.write(text)
+
+            last_position += len(text) + 1
 
-                last_position += len(text) + 1
+            # the document was read, free its elements
+            root.clear()
 
-        return annotations
+        if f is not None:
+            f.close()
+            self._content_file = self.primary_data_file
+
+    def get_root_tiers(self):
+        return [poioapi.io.graf.Tier('doc')]
+
+    def get_child_tiers_for_tier(self, tier):
+        pass
+
+    def get_annotations_for_tier(self, tier, annotation_parent=None):
+        if tier.name != "doc":
+            return []
+
+        if self._annotations is None:
+            self._read_documents()
+
+        return self._annotations
 
     def region_for_annotation(self, annotation):
         return self.documents_map[annotation.id]
@@ -94,8 +152,14 @@ class Parser(poioapi.io.graf.BaseParser):
 
         """
 
+        if self._annotations is None:
+            self._read_documents()
+
         primary_data = poioapi.io.graf.PrimaryData()
         primary_data.type = poioapi.io.graf.TEXT
-        primary_data.content = "\n".join(self.documents)
+        if self._content_file is None:
+            primary_data.content = "\n".join(self.documents)
+        else:
+            primary_data.set_content_file(self._content_file)
 
         return primary_data
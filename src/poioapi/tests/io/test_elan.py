@@ -8,7 +8,11 @@
 # For license information, see LICENSE.TXT
 
 import os
+import shutil
+import tempfile
+import xml.etree.ElementTree as ET
 
+import poioapi.annotationgraph
 import poioapi.io.elan
 import poioapi.io.graf
 
@@ -80,6 +84,20 @@ class TestElan:
 
         assert has_regions == True
 
+    def test_get_tier_by_name(self):
+        tier = self.elan.get_tier_by_name("W-IPA")
+        assert tier.name == "W-IPA"
+        assert tier.linguistic_type == "phonetic_transcription"
+        assert self.elan.tier_has_regions(tier) == False
+
+        assert self.elan.get_tier_by_name("X-Spch") is None
+
+    def test_time_order(self):
+        # ts62 has no time value, it is the mean of ts61 and ts64
+        assert self.elan.time_order["ts61"] == 11470
+        assert self.elan.time_order["ts64"] == 11940
+        assert self.elan.time_order["ts62"] == 11705
+
     def test_region_for_annotation(self):
         root_tier = self.elan.get_root_tiers()[1] # W-Spch
         root_tier_annotations = self.elan.get_annotations_for_tier(root_tier)
@@ -94,4 +112,88 @@ class TestElan:
 
     def test__annotation_for_region(self):
         annotation = self.elan._annotation_for_region("W-Spch", 780, 1340)
-        assert annotation.attrib["ANNOTATION_ID"] == "a8"
\ No newline at end of file
+        assert annotation.attrib["ANNOTATION_ID"] == "a8"
+
+    def test__tiers_parents_first(self):
+        tiers = [t.attrib["TIER_ID"] for t in self.elan._tiers_parents_first()]
+        assert sorted(tiers) == sorted(t.attrib["TIER_ID"]
+                                       for t in self.elan.tree.findall("TIER"))
+        for t in self.elan.tree.findall("TIER"):
+            if "PARENT_REF" in t.attrib:
+                assert tiers.index(t.attrib["PARENT_REF"]) < \
+                    tiers.index(t.attrib["TIER_ID"])
+
+    def test__region_index(self):
+        regions = self.elan.regions_cache["W-Spch"]
+        region_index = poioapi.io.elan._RegionIndex(regions)
+        for start, end in [(780, 1340), (800, 900), (0, 100), (2000, 30000)]:
+            expected = None
+            for s, e in regions:
+                if s <= start and e >= end:
+                    expected = regions[(s, e)]
+                    break
+            assert region_index.first_containing(start, end) is expected
+
+    def test_streaming(self):
+        elan = poioapi.io.elan.Parser(self.filename, streaming=True)
+
+        assert elan.time_order == self.elan.time_order
+        assert elan.regions_map == self.elan.regions_map
+        assert poioapi.io.elan.ET.tostring(elan.meta_information) == \
+            poioapi.io.elan.ET.tostring(self.elan.meta_information)
+        for parent, annotations in self.elan.annotations_for_parent.items():
+            assert [(a.id, a.value, a.features)
+                    for a in elan.annotations_for_parent[parent]] == \
+                [(a.id, a.value, a.features) for a in annotations]
+
+
+class TestWriter:
+    """
+    This class contain the test methods to the
+    class io.elan.Writer.
+
+    """
+
+    def setup(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, "input.eaf")
+        self.outputfile = os.path.join(self.tmpdir, "output.eaf")
+
+        refs = "".join(
+            '<ANNOTATION><REF_ANNOTATION ANNOTATION_ID="r{0}" '
+            'ANNOTATION_REF="a1"><ANNOTATION_VALUE>v{0}</ANNOTATION_VALUE>'
+            '</REF_ANNOTATION></ANNOTATION>'.format(i) for i in range(3))
+        with open(self.filename, "w") as f:
+            f.write("""<?xml version="1.0" encoding="UTF-8"?>
+<ANNOTATION_DOCUMENT FORMAT="2.7" VERSION="2.7">
+<HEADER MEDIA_FILE="" TIME_UNITS="milliseconds">
+<MEDIA_DESCRIPTOR MEDIA_URL="file:///example.wav" MIME_TYPE="audio/x-wav"/>
+</HEADER>
+<TIME_ORDER>
+<TIME_SLOT TIME_SLOT_ID="ts1" TIME_VALUE="0"/>
+<TIME_SLOT TIME_SLOT_ID="ts2" TIME_VALUE="1000"/>
+</TIME_ORDER>
+<TIER TIER_ID="P" LINGUISTIC_TYPE_REF="utt"><ANNOTATION>
+<ALIGNABLE_ANNOTATION ANNOTATION_ID="a1" TIME_SLOT_REF1="ts1"
+TIME_SLOT_REF2="ts2"><ANNOTATION_VALUE>p</ANNOTATION_VALUE>
+</ALIGNABLE_ANNOTATION></ANNOTATION></TIER>
+<TIER TIER_ID="R" LINGUISTIC_TYPE_REF="trn" PARENT_REF="P">{0}</TIER>
+<LINGUISTIC_TYPE LINGUISTIC_TYPE_ID="utt" TIME_ALIGNABLE="true"/>
+<LINGUISTIC_TYPE LINGUISTIC_TYPE_ID="trn" TIME_ALIGNABLE="false"/>
+</ANNOTATION_DOCUMENT>""".format(refs))
+
+    def teardown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_write(self):
+        ag = poioapi.annotationgraph.AnnotationGraph.from_elan(self.filename)
+        ag.to_elan(self.outputfile)
+
+        tree = ET.parse(self.outputfile).getroot()
+        [tier] = [t for t in tree.findall("TIER") if t.attrib["TIER_ID"] == "R"]
+        annotations = [a.attrib for a in tier.findall("ANNOTATION/*")]
+
+        assert [a["ANNOTATION_ID"] for a in annotations] == ["r0", "r1", "r2"]
+        assert [a["ANNOTATION_REF"] for a in annotations] == ["a1"] * 3
+        assert [a.get("PREVIOUS_ANNOTATION") for a in annotations] == \
+            [None, "r0", "r1"]
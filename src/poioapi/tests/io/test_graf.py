@@ -8,12 +8,18 @@
 # For license information, see LICENSE.TXT
 
 import os
+import codecs
+import shutil
+import filecmp
+import tempfile
 
 import poioapi.io.elan
 import poioapi.io.graf
 
 import xml.etree.ElementTree
 
+import graf
+
 
 class TestBaseParser:
 
@@ -189,3 +195,217 @@ class TestGrAFConverter:
             ['phonetic_transcription..W-IPA']]
 
         assert expected_tier_hierarchies in converter.tier_hierarchies
+
+    def test_tier_hierarchies_for_pairs(self):
+        pairs = [("utterance", None), ("word", "utterance"), ("wfw", "word"),
+                 ("graid", "word"), ("translation", "utterance"),
+                 ("utterance2", None), ("word2", "utterance2"),
+                 ("wfw", "word2")]
+
+        tier_hierarchies = poioapi.io.graf.tier_hierarchies_for_pairs(pairs)
+
+        assert tier_hierarchies == [
+            ["utterance", ["word", ["wfw"], ["graid"]], ["translation"]],
+            ["utterance2", ["word2", ["wfw"]]]]
+
+    def test_tier_table(self):
+        tier_table = self.converter.tier_table
+
+        assert tier_table.tiers == ["utterance", "word", "graid", "wfw"]
+        code = tier_table.code_for_id("word..n2")
+        assert tier_table.tiers[code] == "word"
+        assert tier_table.code_for_id("word..n3") == code
+
+        # the converter stores the tier code on the nodes
+        for node in self.converter.graf.nodes:
+            assert tier_table.code_for_node(node) == \
+                tier_table.code_for_id(node.id)
+            assert tier_table.names_for_node(node) == \
+                tier_table.names_for_id(node.id)
+
+        tier_table = poioapi.io.graf.TierTable()
+        assert tier_table.names_for_id("words..W-Words..na5") == \
+            ("words", "words..W-Words")
+        assert len(tier_table) == 1
+        assert tier_table.names_for_node(graf.Node("words..W-Words..na6")) \
+            == ("words", "words..W-Words")
+        assert len(tier_table) == 1
+
+    def test_lazy_parse(self):
+        converter = poioapi.io.graf.GrAFConverter(SimpleParser(), lazy=True)
+        converter.parse()
+
+        assert converter.tier_hierarchies == \
+            self.converter.tier_hierarchies
+        assert len(converter.graf.nodes) == 0
+
+        nodes = converter.load_tier("word")
+        assert len(converter.graf.nodes) == 10
+        assert nodes == list(converter.graf.nodes)
+        assert converter.load_tier("word") == []
+        assert converter.graf.edges['e2'].from_node == \
+            converter.graf.nodes['utterance..n0']
+
+        converter.load_all_tiers()
+        assert sorted(converter.graf.nodes.keys()) == \
+            sorted(self.graph.nodes.keys())
+
+    def test_parse_caches_tier_information(self):
+        parser = CountingParser()
+        converter = poioapi.io.graf.GrAFConverter(parser)
+        converter.parse()
+
+        assert sorted(parser.child_tier_calls) == sorted(SimpleParser.tiers)
+        assert sorted(parser.has_regions_calls) == sorted(SimpleParser.tiers)
+        assert sorted(converter.graf.nodes.keys()) == \
+            sorted(self.graph.nodes.keys())
+        children = converter.graf.nodes['word..n2'].iter_children()
+        assert [n.id for n in children] == \
+            [n.id for n in self.graph.nodes['word..n2'].iter_children()]
+
+
+class TestWriter:
+    def setup(self):
+        filename = os.path.join(os.path.dirname(__file__), "..",
+            "sample_files", "elan_graf", "example.eaf")
+        converter = poioapi.io.graf.GrAFConverter(
+            poioapi.io.elan.Parser(filename))
+        converter.parse()
+        self.graph = converter.graf
+        self.tier_table = converter.tier_table
+        self.tmpdir = tempfile.mkdtemp()
+
+    def teardown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _writer(self):
+        writer = poioapi.io.graf.Writer()
+        writer._tier_table = self.tier_table
+        return writer
+
+    def _files(self, prefix):
+        writer = self._writer()
+        nodes = writer._partition(self.graph.nodes, writer._tier_for_node)
+        edges = writer._partition(self.graph.edges,
+            lambda e: writer._tier_for_node(e.to_node))
+        files = []
+        for tier_name in sorted(nodes):
+            out_graf = graf.Graph()
+            out_graf.nodes = nodes[tier_name]
+            out_graf.edges = edges.get(tier_name, [])
+            out_graf.annotation_spaces.add(graf.AnnotationSpace(tier_name))
+            files.append((os.path.join(self.tmpdir, "{0}-{1}.xml".format(
+                prefix, tier_name)), out_graf))
+        return files
+
+    def test_partition(self):
+        writer = self._writer()
+        nodes = list(self.graph.nodes)
+        partition = writer._partition(nodes, writer._tier_for_node)
+
+        # every node is in exactly one partition, the partition of its tier
+        assert sorted(n.id for p in partition.values() for n in p) == \
+            sorted(n.id for n in nodes)
+        for tier_name, tier_nodes in partition.items():
+            assert all(n.id.rsplit("..", 1)[0] == tier_name
+                       for n in tier_nodes)
+
+        # the tiers and the nodes of each tier keep the order of the graph
+        tiers = []
+        for n in nodes:
+            if n.id.rsplit("..", 1)[0] not in tiers:
+                tiers.append(n.id.rsplit("..", 1)[0])
+        assert list(partition) == tiers
+        for tier_name, tier_nodes in partition.items():
+            assert tier_nodes == [n for n in nodes
+                                  if n.id.rsplit("..", 1)[0] == tier_name]
+
+        assert writer._partition([], writer._tier_for_node) == {}
+
+        # nodes without a tier code are partitioned by their ID
+        node = graf.Node("words..W-Words..na1000")
+        assert writer._partition([node], writer._tier_for_node) == \
+            {"words..W-Words": [node]}
+
+        words = partition["words..W-Words"]
+        assert writer._partition(words, writer._tier_for_node) == \
+            {"words..W-Words": words}
+
+        # an edge belongs to the tier of its target node, a root tier is an
+        # empty tier for the edges and has no partition
+        edges = writer._partition(self.graph.edges,
+            lambda e: writer._tier_for_node(e.to_node))
+        assert sum(len(p) for p in edges.values()) == len(self.graph.edges)
+        assert "utterance..W-Spch" not in edges
+
+    def test_render_parallel(self):
+        for filename, out_graf in self._files("sequential"):
+            graf.GrafRenderer(filename).render(out_graf)
+
+        writer = poioapi.io.graf.Writer()
+        writer.render_workers = 2
+        writer._render_parallel(self._files("parallel"))
+
+        for filename, _ in self._files("sequential"):
+            parallel = filename.replace("sequential-", "parallel-")
+            assert filecmp.cmp(filename, parallel, False)
+
+
+class TestPrimaryData:
+    def setup(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, "primary.txt")
+        self.text = u"Kleef \u00e4\u00f6 \u4e2d\n" * 2000
+        with codecs.open(self.filename, "w", "utf-8") as f:
+            f.write(self.text)
+
+    def teardown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_text_for_region(self):
+        primary_data = poioapi.io.graf.PrimaryData()
+        primary_data.set_content_file(self.filename)
+
+        for start, end in [(0, 5), (6, 8), (4090, 4100), (8192, 8193),
+                           (len(self.text) - 3, len(self.text) + 10)]:
+            assert primary_data.text_for_region(start, end) == \
+                self.text[start:end]
+        assert primary_data.content == self.text
+        primary_data.close()
+
+        primary_data.content = self.text
+        assert primary_data.content_file is None
+        assert primary_data.text_for_region(6, 8) == self.text[6:8]
+
+
+class CountingParser(SimpleParser):
+
+    def __init__(self):
+        self.child_tier_calls = []
+        self.has_regions_calls = []
+
+    def get_child_tiers_for_tier(self, tier):
+        self.child_tier_calls.append(tier.name)
+        return SimpleParser.get_child_tiers_for_tier(self, tier)
+
+    def tier_has_regions(self, tier):
+        self.has_regions_calls.append(tier.name)
+        return SimpleParser.tier_has_regions(self, tier)
+
+
+def _worker_item(position):
+    return poioapi.io.graf.worker_data()[position]
+
+
+class TestWorkerPool:
+
+    def test_worker_data(self):
+        pools = [poioapi.io.graf.worker_pool(2, data)
+                 for data in (["a", "b", "c"], ["d", "e", "f"])]
+        try:
+            assert [pool.map(_worker_item, range(3)) for pool in pools] == \
+                [["a", "b", "c"], ["d", "e", "f"]]
+        finally:
+            for pool in pools:
+                pool.close()
+                pool.join()
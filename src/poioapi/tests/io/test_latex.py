@@ -9,9 +9,12 @@
 
 import poioapi.io.latex
 import poioapi.annotationgraph
+import poioapi.data
 
 import os.path
 import filecmp
+import shutil
+import tempfile
 
 
 class TestWriter():
@@ -50,4 +53,24 @@ class TestWriter():
         writer.write(output, ag)
 
         assert(os.path.getsize(output) == os.path.getsize(expected))
-        assert(filecmp.cmp(output, expected, False))
\ No newline at end of file
+        assert(filecmp.cmp(output, expected, False))
+
+    def test_write_records(self):
+        input = os.path.join(os.path.dirname(__file__), "..",
+            "sample_files", "toolbox_graf", "toolbox_latex.txt")
+
+        expected = os.path.join(os.path.dirname(__file__), "..",
+            "sample_files", "latex", "toolbox_latex_expected.tex")
+
+        tmpdir = tempfile.mkdtemp()
+        output = os.path.join(tmpdir, "toolbox_latex.tex")
+
+        records = poioapi.annotationgraph.AnnotationGraph.iter_records(input,
+            poioapi.data.TOOLBOX)
+        writer = poioapi.io.latex.Writer()
+        writer.write_records(output, records)
+
+        try:
+            assert(filecmp.cmp(output, expected, False))
+        finally:
+            shutil.rmtree(tmpdir)
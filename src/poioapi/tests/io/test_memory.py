@@ -76,3 +76,28 @@ class TestGrAFConverter:
     def test_region_for_annotations(self):
         assert(self.converter.region_for_annotation == \
             {0: (0, 100), 1: (101, 200)})
+
+    def test_nodes_for_tier(self):
+        nodes = self.converter.nodes_for_tier("utterance")
+        assert([n.id for n in nodes] == ['utterance..n0', 'utterance..n1'])
+
+        words = self.converter.nodes_for_tier("word", nodes[1])
+        assert([n.id for n in words] ==
+            ['word..n6', 'word..n7', 'word..n8', 'word..n9'])
+        assert(words[0].parent == nodes[1])
+
+        assert(len(self.converter.nodes_for_tier("graid")) == 8)
+
+    def test_node_annotations(self):
+        node = self.converter.nodes_for_tier("utterance")[0]
+        annotation = node.annotations.get_first()
+
+        assert(annotation.id == 0)
+        assert(annotation.features['annotation_value'] == "this is a test")
+        assert(node.links[0][0].anchors == [0, 100])
+
+    def test_interned_values(self):
+        # "this", "is" and "test" appear in both utterances, "a" is a word
+        # and a wfw value
+        assert(len(self.converter) == 26)
+        assert(len(self.converter.values) == 22)
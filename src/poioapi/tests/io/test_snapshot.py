@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+#
+# Poio Tools for Linguists
+#
+# Copyright (C) 2009-2014 Poio Project
+# Author: Peter Bouda <pbouda@cidles.eu>
+# URL: <http://media.cidles.eu/poio/>
+# For license information, see LICENSE.TXT
+
+import os
+import shutil
+import tempfile
+
+import poioapi.annotationgraph
+import poioapi.io.graf
+import poioapi.io.snapshot
+
+class TestSnapshot:
+    """
+    This class contain the test methods to the
+    class io.snapshot.py.
+
+    """
+
+    def setup(self):
+        self.filename = os.path.join(os.path.dirname(__file__), "..",
+            "sample_files", "elan_graf", "example.eaf")
+        self.tmpdir = tempfile.mkdtemp()
+        self.snapshot = os.path.join(self.tmpdir, "example.snap")
+
+    def teardown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _node_data(self, ag):
+        return [(node.id,
+                 [(a.label, a.id, sorted(a.features.items()))
+                  for a in node.annotations],
+                 [[(r.id, r.anchors) for r in link] for link in node.links],
+                 [child.id for child in node.iter_children()])
+                for node in ag.graf.nodes]
+
+    def test_write_read(self):
+        ag = poioapi.annotationgraph.AnnotationGraph.from_elan(self.filename)
+        ag.to_snapshot(self.snapshot)
+
+        reader = poioapi.io.snapshot.Reader(self.snapshot)
+        reader.read()
+
+        assert reader.tier_hierarchies == ag.tier_hierarchies
+        assert reader.root_tiers == ag.root_tiers
+        assert reader.meta_information.tag == ag.meta_information.tag
+        assert [e.id for e in reader.graf.edges] == \
+            [e.id for e in ag.graf.edges]
+        assert reader.graf.header.roots == ag.graf.header.roots
+
+    def test_from_snapshot(self):
+        ag = poioapi.annotationgraph.AnnotationGraph.from_elan(self.filename)
+        ag.to_snapshot(self.snapshot)
+
+        loaded = poioapi.annotationgraph.AnnotationGraph.from_snapshot(
+            self.snapshot)
+
+        assert self._node_data(loaded) == self._node_data(ag)
+        assert loaded.source_type == ag.source_type
+        assert loaded.as_html_table() == ag.as_html_table()
+
+    def test_list_arrays(self):
+        ag = poioapi.annotationgraph.AnnotationGraph.from_elan(self.filename)
+        ag.to_snapshot(self.snapshot)
+        with open(self.snapshot, "rb") as f:
+            expected = f.read()
+
+        # platforms without an array type with 8 byte items use lists
+        typecode = poioapi.io.graf.INT64_TYPECODE
+        poioapi.io.graf.INT64_TYPECODE = None
+        try:
+            ag.to_snapshot(self.snapshot)
+            with open(self.snapshot, "rb") as f:
+                assert f.read() == expected
+
+            loaded = poioapi.annotationgraph.AnnotationGraph.from_snapshot(
+                self.snapshot)
+        finally:
+            poioapi.io.graf.INT64_TYPECODE = typecode
+
+        assert self._node_data(loaded) == self._node_data(ag)
+
+    def test_invalid_file(self):
+        with open(self.snapshot, "wb") as f:
+            f.write(b"\0" * 64)
+
+        reader = poioapi.io.snapshot.Reader(self.snapshot)
+        try:
+            reader.read()
+        except poioapi.io.snapshot.SnapshotError:
+            pass
+        else:
+            assert False
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+#
+# Poio Tools for Linguists
+#
+# Copyright (C) 2009-2014 Poio Project
+# Author: Peter Bouda <pbouda@cidles.eu>
+# URL: <http://media.cidles.eu/poio/>
+# For license information, see LICENSE.TXT
+
+import os
+import json
+import shutil
+import tempfile
+
+import poioapi.annotationgraph
+import poioapi.io.stats
+
+class TestConversionStats:
+    """
+    This class contain the test methods to the
+    class io.stats.py.
+
+    """
+
+    def setup(self):
+        self.filename = os.path.join(os.path.dirname(__file__), "..",
+            "sample_files", "elan_graf", "example.eaf")
+        self.phases = []
+        self.stats = poioapi.io.stats.ConversionStats(
+            callback=lambda name, seconds: self.phases.append(name))
+
+    def test_from_file(self):
+        ag = poioapi.annotationgraph.AnnotationGraph.from_elan(self.filename,
+            stats=self.stats)
+
+        assert self.phases == ['read', 'convert', 'index']
+        assert self.stats.totals()['nodes'] == len(ag.graf.nodes)
+        assert self.stats.totals()['regions'] == len(ag.graf.regions)
+        assert self.stats.tiers['utterance..W-Spch']['nodes'] == \
+            len(ag.nodes_for_tier('utterance..W-Spch'))
+        assert self.stats.peaks['nodes'] == len(ag.graf.nodes)
+
+    def test_write(self):
+        ag = poioapi.annotationgraph.AnnotationGraph.from_elan(self.filename,
+            stats=self.stats)
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            ag.to_elan(os.path.join(tmpdir, "example.eaf"))
+        finally:
+            shutil.rmtree(tmpdir)
+
+        assert self.phases == ['read', 'convert', 'index', 'write']
+        assert self.stats.calls['write'] == 1
+
+    def test_to_json(self):
+        poioapi.annotationgraph.AnnotationGraph.from_elan(self.filename,
+            stats=self.stats)
+
+        result = json.loads(self.stats.to_json())
+
+        assert list(result['phases'].keys()) == ['read', 'convert', 'index']
+        assert result['phases']['convert']['calls'] == 1
+        assert result['totals'] == self.stats.totals()
+        assert result['peaks'] == self.stats.peaks
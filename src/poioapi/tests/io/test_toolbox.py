@@ -71,3 +71,32 @@ class TestParser:
             tier, annotation_parent)
 
         assert len(tier_annotations) == 8
+
+    def test_iter_records(self):
+        parser = poioapi.io.toolbox.Parser(self.filename, "ref",
+            streaming=True)
+        assert parser.get_annotations_for_tier(
+            parser.get_root_tiers()[0]) == []
+
+        def subtree(p, tier, annotation):
+            result = []
+            for child_tier in p.get_child_tiers_for_tier(tier):
+                for a in p.get_annotations_for_tier(child_tier, annotation):
+                    result.append((child_tier.name, a.id, a.value,
+                                   subtree(p, child_tier, a)))
+            return result
+
+        root_tier = self.parser.get_root_tiers()[0]
+        expected = [(a.id, a.value, subtree(self.parser, root_tier, a))
+            for a in self.parser.get_annotations_for_tier(root_tier)]
+
+        records = []
+        for tier, annotation in parser.iter_records():
+            assert tier.name == "ref"
+            # only the current record is kept by the parser
+            assert parser.get_annotations_for_tier(tier) == [annotation]
+            records.append((annotation.id, annotation.value,
+                            subtree(parser, tier, annotation)))
+
+        assert len(records) == 295
+        assert records == expected
@@ -10,6 +10,9 @@
 from __future__ import unicode_literals
 
 import os
+import io
+
+import graf
 
 from poioapi import data
 import poioapi.annotationgraph
@@ -37,12 +40,174 @@ class TestAnnotationGraph:
         root_nodes = self.annotation_graph.root_nodes()
         assert(len(root_nodes) == 9)
 
+    def test_memory(self):
+        filename = os.path.abspath(os.path.join(os.path.dirname( __file__ ),
+            '..', '..', '..', 'example_data', 'turkish.eaf'))
+        annotation_graph = \
+            poioapi.annotationgraph.AnnotationGraph.from_elan(filename,
+                memory=True)
+
+        assert(annotation_graph.graf is None)
+        assert([n.id for n in annotation_graph.root_nodes()] ==
+            [n.id for n in self.annotation_graph.root_nodes()])
+        assert(annotation_graph.as_html_table() ==
+            self.annotation_graph.as_html_table())
+
+    def test_memory_write(self):
+        filename = os.path.abspath(os.path.join(os.path.dirname( __file__ ),
+            "sample_files", "elan_graf", "example.eaf"))
+        annotation_graph = \
+            poioapi.annotationgraph.AnnotationGraph.from_elan(filename,
+                memory=True)
+
+        for write in [annotation_graph.to_elan, annotation_graph.to_graf,
+                      annotation_graph.to_snapshot]:
+            try:
+                write("output")
+            except ValueError:
+                pass
+            else:
+                assert(False)
+
+    def test_streaming(self):
+        filename = os.path.abspath(os.path.join(os.path.dirname( __file__ ),
+            '..', '..', '..', 'example_data', 'turkish.eaf'))
+        annotation_graph = \
+            poioapi.annotationgraph.AnnotationGraph.from_elan(filename,
+                streaming=True)
+
+        def node_data(ag):
+            return [(n.id,
+                     [(a.label, a.id, sorted(a.features.items()))
+                      for a in n.annotations],
+                     [[(r.id, r.anchors) for r in l] for l in n.links],
+                     [c.id for c in n.iter_children()])
+                    for n in ag.graf.nodes]
+
+        assert(node_data(annotation_graph) ==
+            node_data(self.annotation_graph))
+        assert(annotation_graph.tier_hierarchies ==
+            self.annotation_graph.tier_hierarchies)
+        assert(annotation_graph.as_html_table() ==
+            self.annotation_graph.as_html_table())
+
+    def test_lazy(self):
+        filename = os.path.abspath(os.path.join(os.path.dirname( __file__ ),
+            '..', '..', '..', 'example_data', 'turkish.eaf'))
+        annotation_graph = \
+            poioapi.annotationgraph.AnnotationGraph.from_elan(filename,
+                lazy=True)
+
+        root_nodes = annotation_graph.root_nodes()
+        assert(len(annotation_graph.graf.nodes) == 9)
+        assert(annotation_graph.as_html_table() ==
+            self.annotation_graph.as_html_table())
+
+        # the indexes were updated for each loaded tier
+        for tier_name in annotation_graph.structure_type_handler.\
+                flat_data_hierarchy:
+            assert([n.id for n in annotation_graph.nodes_for_tier(tier_name,
+                    root_nodes[0])] ==
+                [n.id for n in self.annotation_graph.nodes_for_tier(
+                    tier_name, self.annotation_graph.root_nodes()[0])])
+
+        annotation_graph.load_all_tiers()
+        assert(len(annotation_graph.graf.nodes) ==
+            len(self.annotation_graph.graf.nodes))
+
+    def test_from_graf_tiers(self):
+        filename = os.path.join(os.path.dirname(__file__), "sample_files",
+            "elan_graf", "example.hdr")
+        annotation_graph = poioapi.annotationgraph.AnnotationGraph.from_graf(
+            filename, tiers=["words"])
+
+        # the utterance space is loaded as dependency of the word space
+        assert(len(annotation_graph.nodes_for_tier("utterance")) == 15)
+        assert(len(annotation_graph.graf.nodes) == 112)
+        assert(len(annotation_graph.graf.annotation_spaces) == 2)
+
+        gestures = annotation_graph.nodes_for_tier("gestures")
+        assert(len(gestures) > 0)
+        assert(len(annotation_graph.graf.nodes) == 112 + len(gestures))
+
+        full_graph = poioapi.annotationgraph.AnnotationGraph.from_graf(
+            filename)
+        annotation_graph.load_all_tiers()
+        assert(sorted(annotation_graph.graf.nodes.keys()) ==
+            sorted(full_graph.graf.nodes.keys()))
+        assert(annotation_graph.tier_loader is None)
+
+    def test_nodes_for_time_range(self):
+        filename = os.path.join(os.path.dirname(__file__), "sample_files",
+            "elan_graf", "example.eaf")
+        annotation_graph = \
+            poioapi.annotationgraph.AnnotationGraph.from_elan(filename)
+        words = annotation_graph.nodes_for_tier("words")
+
+        def region(node):
+            return node.links[0][0].start, node.links[0][0].end
+
+        expected = sorted([n for n in words
+                           if region(n)[0] < 15000 and region(n)[1] > 12300],
+                          key=lambda n: region(n)[0])
+        result = annotation_graph.nodes_for_time_range("words", 12300, 15000)
+        assert(len(result) > 0)
+        assert(result == expected)
+
+        # the sample file contains a word with an end before its start
+        expected = [n for n in words
+                    if 12300 <= region(n)[0] <= region(n)[1] <= 15000]
+        result = annotation_graph.nodes_for_time_range("words", 12300, 15000,
+            "within")
+        assert(sorted(n.id for n in result) == sorted(n.id for n in expected))
+
+        word = result[0]
+        start, end = region(word)
+        result = annotation_graph.nodes_for_time_range("utterance",
+            start, end, "contains")
+        assert([n.id for n in result] ==
+            [n.id for n in word.iter_parents()])
+
+        node = annotation_graph.nearest_node_for_time("words", start)
+        assert(region(node)[0] == start)
+
+        interval_index = annotation_graph.interval_index("words")
+        assert(annotation_graph.interval_index("words") is interval_index)
+
+    def test_root_nodes_cache(self):
+        root_nodes = self.annotation_graph.root_nodes()
+        assert(self.annotation_graph.root_nodes() == root_nodes)
+
+        self.annotation_graph.structure_type_handler = data.DataStructureType(
+            self.annotation_graph.tier_hierarchies[0][1])
+        root_nodes = self.annotation_graph.root_nodes()
+        assert(len(root_nodes) > 9)
+        assert(all(n.id.startswith("Wort..") for n in root_nodes))
+
     def test_nodes_for_tier(self):
         root_nodes = self.annotation_graph.root_nodes()
         nodes = self.annotation_graph.nodes_for_tier("Äußerung", root_nodes[0])
         
         assert(len(nodes) == 0)
 
+        nodes = self.annotation_graph.nodes_for_tier("Wort", root_nodes[0])
+        assert([n.id for n in nodes] ==
+            [n.id for n in root_nodes[0].iter_children()
+             if n.id.startswith("Wort..")])
+
+        nodes = self.annotation_graph.nodes_for_tier("Glosse..P-Gloss")
+        assert(len(nodes) == len([n for n in self.annotation_graph.graf.nodes
+            if n.id.startswith("Glosse..P-Gloss..")]))
+
+    def test_add_node(self):
+        root_nodes = self.annotation_graph.root_nodes()
+        node = graf.Node("Glosse..P-Gloss..na_new")
+        self.annotation_graph.add_node(node, root_nodes[0])
+
+        nodes = self.annotation_graph.nodes_for_tier("Glosse", root_nodes[0])
+        assert(nodes[-1] == node)
+        assert(node in self.annotation_graph.nodes_for_tier("Glosse..P-Gloss"))
+
     def test_annotations_for_tier(self):
         node = self.annotation_graph.graf.nodes["Glosse..P-Gloss..na262"]
         annotations = self.annotation_graph.annotations_for_tier("Glosse", node)
@@ -64,6 +229,15 @@ class TestAnnotationGraph:
         html = self.annotation_graph.as_html_table()
         assert(len(html) > 0)
 
+    def test_write_html_table(self):
+        stream = io.StringIO()
+        self.annotation_graph.write_html_table(stream)
+        assert(stream.getvalue() == self.annotation_graph.as_html_table())
+
+        fragments = list(self.annotation_graph.iter_html_table(
+            full_html=False))
+        assert(len(fragments) == 9)
+
     def test_append_filter(self):
         self.anngraphfilter.set_filter_for_tier("Glosse..P-Gloss", "ANOM")
         self.annotation_graph.append_filter(self.anngraphfilter)
@@ -80,6 +254,66 @@ class TestAnnotationGraph:
         assert self.annotation_graph.filtered_node_ids[-1] == \
             ['Äußerung..P-Spch..na2', 'Äußerung..P-Spch..na9']
 
+    def test_stacked_filters(self):
+        self.anngraphfilter.set_filter_for_tier("Glosse..P-Gloss", "ANOM")
+        self.annotation_graph.append_filter(self.anngraphfilter)
+
+        second_filter = self.annotation_graph.create_filter_for_dict(
+            { "Äußerung..P-Spch": "." })
+        self.annotation_graph.append_filter(second_filter)
+
+        filtered_node_ids = self.annotation_graph.filtered_node_ids[-1]
+        assert filtered_node_ids == \
+            ['Äußerung..P-Spch..na2', 'Äußerung..P-Spch..na9']
+        assert 'Äußerung..P-Spch..na2' in filtered_node_ids
+        assert 'Äußerung..P-Spch..na1' not in filtered_node_ids
+
+        html = self.annotation_graph.as_html_table(True)
+        assert html.count("margin-bottom:20px") == 2
+
+    def test_parallel_filter(self):
+        self.anngraphfilter.set_filter_for_tier("Glosse..P-Gloss", "ANOM")
+        self.annotation_graph.append_filter(self.anngraphfilter)
+        sequential = self.annotation_graph.filtered_node_ids[-1]
+        matchobject = self.anngraphfilter.matchobject
+
+        parallel_filter = poioapi.annotationgraph.AnnotationGraphFilter(
+            self.annotation_graph)
+        parallel_filter.set_filter_for_tier("Glosse..P-Gloss", "ANOM")
+
+        min_nodes = poioapi.annotationgraph.PARALLEL_FILTER_MIN_NODES
+        poioapi.annotationgraph.PARALLEL_FILTER_MIN_NODES = 0
+        self.annotation_graph.filter_workers = 2
+        try:
+            self.annotation_graph.pop_filter()
+            self.annotation_graph.append_filter(parallel_filter)
+        finally:
+            poioapi.annotationgraph.PARALLEL_FILTER_MIN_NODES = min_nodes
+
+        assert self.annotation_graph.filtered_node_ids[-1] == sequential
+        assert self.annotation_graph.filtered_node_ids[-1].positions == \
+            sequential.positions
+        assert parallel_filter.matchobject == matchobject
+
+    def test_token_index(self):
+        self.anngraphfilter.set_filter_for_tier("Glosse..P-Gloss", r"\bANOM\b")
+        self.annotation_graph.append_filter(self.anngraphfilter)
+        filtered_node_ids = self.annotation_graph.filtered_node_ids[-1]
+        matchobject = self.anngraphfilter.matchobject
+        self.annotation_graph.pop_filter()
+
+        token_index = self.annotation_graph.build_token_index()
+        positions = token_index.root_positions("Glosse..P-Gloss", r"\bANOM\b")
+        assert positions == set(filtered_node_ids.positions)
+        assert token_index.root_positions("Glosse..P-Gloss", "AN.M") is None
+
+        indexed_filter = poioapi.annotationgraph.AnnotationGraphFilter(
+            self.annotation_graph)
+        indexed_filter.set_filter_for_tier("Glosse..P-Gloss", r"\bANOM\b")
+        self.annotation_graph.append_filter(indexed_filter)
+        assert self.annotation_graph.filtered_node_ids[-1] == filtered_node_ids
+        assert indexed_filter.matchobject == matchobject
+
     def test_create_filter_for_dict(self):
         search_terms = { "Glosse..P-Gloss": "yesterday" }
         self.anngraphfilter = self.annotation_graph.create_filter_for_dict(
@@ -141,3 +375,22 @@ class TestAnnotationGraphFilter:
 
         assert(self.anngraphfilter.element_passes_filter(element)
                == expected_result)
+
+    def test_filter_outside_hierarchy(self):
+        self.anngraphfilter.set_filter_for_tier("not_in_hierarchy", "nc")
+        compiled_filter = self.anngraphfilter.compile()
+        assert(not compiled_filter.has_patterns)
+
+        # a tier that is not in the hierarchy never matches
+        element = self.annotation_graph.graf.nodes['utterance..na6']
+        assert(not self.anngraphfilter.element_passes_filter(element))
+
+    def test_compile(self):
+        self.anngraphfilter.set_filter_for_tier("graid2", "nc")
+        compiled_filter = self.anngraphfilter.compile()
+        assert(compiled_filter.has_patterns)
+        assert(self.anngraphfilter.compile() is compiled_filter)
+
+        self.anngraphfilter.set_filter_for_tier("graid2", "")
+        compiled_filter = self.anngraphfilter.compile()
+        assert(not compiled_filter.has_patterns)